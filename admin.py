@@ -0,0 +1,114 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime as dt
+
+from db import slot_key, format_slot, iter_reservations, get_utilization
+
+EXPORT_FIELDS = ['status', 'user_id', 'first_name', 'last_name', 'reservation', 'court_id']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+def parse_bound(text):
+    # "YYYY-MM-DD" or "YYYY-MM-DD HH:MM" -> slot
+    if text is None:
+        return None
+    parsed = dt.strptime(text, '%Y-%m-%d %H:%M' if ' ' in text else '%Y-%m-%d')
+    return slot_key(parsed.date(), parsed.hour)
+
+def iter_export(source='all', since=None, until=None, page_size=500):
+    # Reservations as dicts, archived ones first; since/until bound the
+    # reservation time like journal.iter_records, until is exclusive
+    start = parse_bound(since) or 0
+    end = parse_bound(until) or 2 ** 62
+    for table in (('archive', 'live') if source == 'all' else (source,)):
+        status = 'archived' if table == 'archive' else 'live'
+        for user_id, slot, court_id, first_name, last_name in iter_reservations(table, start, end, page_size):
+            yield {
+                'status': status,
+                'user_id': user_id,
+                'first_name': first_name or '',
+                'last_name': last_name or '',
+                'reservation': format_slot(slot),
+                'court_id': court_id,
+            }
+
+def write_export(rows, file, output_format='csv'):
+    # Writes row by row; returns how many rows were written
+    count = 0
+    if output_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def utilization_report(stats=None):
+    # Built from the utilization counters only, never from reservation rows
+    stats = get_utilization() if stats is None else stats
+    def rows(dimension, label=str):
+        return {
+            label(bucket): {'booked': booked, 'canceled': canceled}
+            for bucket, (booked, canceled) in sorted(stats.get(dimension, {}).items())
+        }
+    # Every booking is counted once per dimension; 'court' covers all of them
+    booked = sum(booked for booked, _ in stats.get('court', {}).values())
+    canceled = sum(canceled for _, canceled in stats.get('court', {}).values())
+    return {
+        'booked': booked,
+        'canceled': canceled,
+        'cancellation_rate': round(canceled / booked, 4) if booked else 0.0,
+        'by_hour': rows('hour', lambda hour: f"{hour:02d}:00"),
+        'by_weekday': rows('weekday', lambda day: WEEKDAYS[day]),
+        'by_month': rows('month', lambda month: f"{month // 100}-{month % 100:02d}"),
+        'by_court': rows('court'),
+    }
+
+def format_utilization(report):
+    # Plain-text summary for the /stats command
+    lines = [
+        f"Bookings: {report['booked']}, canceled: {report['canceled']} ({report['cancellation_rate']:.1%})",
+        "",
+        "By hour:",
+    ]
+    lines += [f"  {hour}  {counts['booked']} booked, {counts['canceled']} canceled" for hour, counts in report['by_hour'].items()]
+    lines += ["", "By weekday:"]
+    lines += [f"  {day}  {counts['booked']} booked, {counts['canceled']} canceled" for day, counts in report['by_weekday'].items()]
+    return '\n'.join(lines)
+
+def export_file(source='all', since=None, until=None, output_format='csv'):
+    # Export spooled to a temporary file on disk, rewound, for sending as a document
+    import tempfile
+    file = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    count = write_export(iter_export(source, since, until), text, output_format)
+    text.flush()
+    text.detach()
+    file.seek(0)
+    return file, count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reservation reports")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="stream reservations as CSV or JSONL")
+    export.add_argument('--source', choices=['all', 'live', 'archive'], default='all')
+    export.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    export.add_argument('--since', help="reservation time lower bound, YYYY-MM-DD[ HH:MM]")
+    export.add_argument('--until', help="reservation time upper bound (exclusive), YYYY-MM-DD[ HH:MM]")
+    export.add_argument('--page-size', type=int, default=500)
+    commands.add_parser('stats', help="utilization counters as JSON")
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        write_export(iter_export(args.source, args.since, args.until, args.page_size), sys.stdout, args.format)
+    else:
+        json.dump(utilization_report(), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
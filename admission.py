@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from outbox import TokenBucket
+
+class Admission:
+    # Cheap checks every update passes before it is queued for a handler:
+    # only text messages and callbacks whose data matches `callback_format`
+    # get in, a callback repeated within `dedup_window` seconds (a user
+    # hammering one button) is dropped, and each user has a token bucket.
+    # Dropped updates are only counted, by reason; none of this touches
+    # SQLite or the Bot API.
+    def __init__(self, callback_format, rate=None, burst=None, dedup_window=None, max_users=None):
+        self.callback_format = callback_format
+        self.rate = rate or float(os.getenv('ADMISSION_USER_RATE', '1'))
+        self.burst = burst or float(os.getenv('ADMISSION_USER_BURST', '5'))
+        self.dedup_window = dedup_window or float(os.getenv('ADMISSION_DEDUP_SECONDS', '3'))
+        self.max_users = max_users or int(os.getenv('ADMISSION_MAX_USERS', '10000'))
+        self._buckets = OrderedDict()
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.dropped = Counter()
+
+    def admit(self, update):
+        message = update.message
+        callback = update.callback_query
+        if message is not None and message.text is not None:
+            user = message.from_user
+        elif callback is not None:
+            if not callback.data or not self.callback_format.fullmatch(callback.data):
+                return self._drop('invalid_callback')
+            user = callback.from_user
+        else:
+            # Edits, stickers, photos, ...: no handler takes them
+            return self._drop('unsupported')
+        if user is None:
+            return self._drop('unsupported')
+        now = time.monotonic()
+        with self._lock:
+            if callback is not None and self._repeated(callback, user.id, now):
+                reason = 'duplicate_callback'
+            elif not self._take(user.id, now):
+                reason = 'rate_limited'
+            else:
+                self.admitted += 1
+                return True
+        return self._drop(reason)
+
+    def _drop(self, reason):
+        # Webhook requests call admit() from several threads at once
+        with self._lock:
+            self.dropped[reason] += 1
+        return False
+
+    def _repeated(self, callback, user_id, now):
+        # Called under the lock. Same user, same keyboard, same button
+        source = callback.message.message_id if callback.message is not None else callback.inline_message_id
+        key = (user_id, source, callback.data)
+        # One window for everyone, so the oldest entries sit at the front
+        while self._recent:
+            oldest, seen = next(iter(self._recent.items()))
+            if seen > now - self.dedup_window:
+                break
+            del self._recent[oldest]
+        if key in self._recent:
+            return True
+        self._recent[key] = now
+        return False
+
+    def _take(self, user_id, now):
+        # Called under the lock; least recently seen users are forgotten first
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        if bucket.delay(now):
+            return False
+        bucket.take()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self.dropped, admitted=self.admitted)
@@ -0,0 +1,77 @@
+# Coroutine handlers of BOT_RUNTIME=async. The menu commands run on the
+# event loop and only leave it for SQLite, through run_blocking; everything
+# else reuses the sync handlers of telegrambot.py on the blocking executor.
+# Replies go through the same outbox in both runtimes.
+import time
+
+from async_runtime import run_blocking
+from db import get_user_reservation, archive_user_reservation, save_user_profile
+from metrics import timed_async_handler
+from routing import TextRouter
+from user_cache import profile_from_user
+
+# The telegrambot module that ran create_app(), set by create_app() itself
+app = None
+
+# Commands handled on the loop; the rest of the text goes to app.router
+router = TextRouter()
+
+@router.command('start')
+async def send_welcome(message):
+    # Only queues replies, so the sync handler never blocks the loop
+    app.send_welcome(message)
+
+@router.command('support')
+async def on_start_command(message):
+    app.on_start_command(message)
+
+@router.command('location')
+async def send_location(message):
+    app.send_location(message)
+
+@router.command('reserve')
+@timed_async_handler
+async def ask_for_date(message):
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    reservation = await run_blocking(get_user_reservation, user_id)
+    if reservation is not None:
+        reservation_slot, _ = reservation
+        if app.slot_timestamp(reservation_slot) > time.time():
+            app.send_already_booked(chat_id, reservation_slot)
+            return
+        await run_blocking(archive_user_reservation, user_id)
+    app.send_date_keyboard(chat_id)
+
+@router.command('cancel')
+@timed_async_handler
+async def cancel(message):
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    reservation = await run_blocking(get_user_reservation, user_id)
+    if reservation is None:
+        app.outbox.send_message(chat_id, "You don't have any reservation to cancel.")
+        return
+    await run_blocking(app.cancel_reservation, user_id, *reservation)
+    app.outbox.send_message(chat_id, "Your reservation has been canceled.")
+
+async def remember_user(user):
+    profile = profile_from_user(user)
+    if app.user_cache.put(profile):
+        await run_blocking(save_user_profile, profile)
+
+@timed_async_handler
+async def route_text(message):
+    await remember_user(message.from_user)
+    handler = router.route(message)
+    if handler is not None:
+        await handler(message)
+    else:
+        await run_blocking(app.router.dispatch, message)
+
+async def process_update(update):
+    # What TeleBot.process_new_updates does for the handlers create_app registers
+    if update.message is not None and update.message.text is not None:
+        await route_text(update.message)
+    elif update.callback_query is not None:
+        await run_blocking(app.route_callback, update.callback_query)
@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import apihelper, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from dispatcher import chat_key
+from metrics import API_SECONDS, API_ERRORS
+
+# Upper bound on concurrent HTTPS connections of the shared aiohttp session
+asyncio_helper.REQUEST_LIMIT = int(os.getenv('ASYNC_HTTP_CONNECTIONS', '100'))
+
+# Threads for SQLite calls (and anything else that blocks) made by coroutine
+# handlers; as many as pooled connections, so none of them waits for one
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASYNC_BLOCKING_WORKERS', os.getenv('SQLITE_POOL_SIZE', '8'))),
+    thread_name_prefix='blocking'
+)
+
+def run_blocking(function, *args, **kwargs):
+    # Awaitable result of function(*args, **kwargs) run on the executor
+    return asyncio.get_running_loop().run_in_executor(_executor, functools.partial(function, *args, **kwargs))
+
+def api_method(name):
+    # send_message -> sendMessage, the label the sync runtime uses
+    first, *rest = name.split('_')
+    return first + ''.join(part.capitalize() for part in rest)
+
+class LoopBot:
+    # Blocking facade over the AsyncTeleBot for code on other threads (the
+    # outbox senders, sync handlers run by run_blocking). Every call becomes a
+    # coroutine on the event loop, so all Bot API traffic shares the loop's
+    # single pooled aiohttp session. Never call it from the loop itself.
+    def __init__(self, bot, loop):
+        self.bot = bot
+        self.loop = loop
+
+    def __getattr__(self, name):
+        method = getattr(self.bot, name)
+        label = api_method(name)
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self.loop).result()
+            except asyncio_helper.ApiTelegramException as e:
+                API_ERRORS.inc(label, str(e.error_code))
+                # The outbox recognises 429s by the sync exception type
+                raise apihelper.ApiTelegramException(e.function_name, e.result, e.result_json) from e
+            except Exception as e:
+                API_ERRORS.inc(label, type(e).__name__)
+                raise
+            finally:
+                API_SECONDS.observe(time.perf_counter() - started, label)
+        return call
+
+class AsyncDispatcher:
+    # Coroutine counterpart of ShardedDispatcher: one task per chat with
+    # updates waiting, which handles them in arrival order, so different
+    # chats interleave on the loop while each chat stays sequential. At most
+    # max_in_flight updates are admitted; polling waits for room beyond that.
+    # Updates `accept` turns down are dropped on arrival, as in ShardedDispatcher.
+    def __init__(self, process, max_in_flight=None, key=chat_key, accept=None):
+        self.process = process
+        self.key = key
+        self.accept = accept
+        self.max_in_flight = max_in_flight or int(os.getenv('ASYNC_MAX_IN_FLIGHT', '10000'))
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.loop = None
+        self._chats = {}
+        self._tasks = set()
+        self._room = None
+
+    def start(self, loop):
+        self.loop = loop
+        self._room = asyncio.Condition()
+
+    async def admit(self, update):
+        # From the loop: waits while max_in_flight updates are being handled
+        if self.accept is not None and not self.accept(update):
+            return
+        async with self._room:
+            await self._room.wait_for(lambda: self.in_flight < self.max_in_flight)
+        self._enqueue(update)
+
+    def submit(self, update, block=True, timeout=None):
+        # From other threads (the webhook route). Never blocks; False when full
+        if self.accept is not None and not self.accept(update):
+            return True
+        if self.loop is None or self.in_flight >= self.max_in_flight:
+            return False
+        self.loop.call_soon_threadsafe(self._enqueue, update)
+        return True
+
+    def _enqueue(self, update):
+        self.in_flight += 1
+        key = self.key(update)
+        waiting = self._chats.get(key)
+        if waiting is not None:
+            waiting.append(update)
+            return
+        self._chats[key] = deque([update])
+        task = self.loop.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key):
+        waiting = self._chats[key]
+        while waiting:
+            update = waiting[0]
+            try:
+                await self.process(update)
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to process update {getattr(update, 'update_id', None)}: {e}")
+            waiting.popleft()
+            self.processed += 1
+            self.in_flight -= 1
+            async with self._room:
+                self._room.notify()
+        del self._chats[key]
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'chats': len(self._chats),
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+class AsyncRuntime:
+    # Event loop, Bot API client and dispatcher of BOT_RUNTIME=async.
+    # create_app() builds it, hands `bot` (the LoopBot) to the outbox and
+    # `dispatcher` to the webhook route; run() then drives the loop.
+    def __init__(self, token, process, accept=None):
+        self.loop = asyncio.new_event_loop()
+        self.async_bot = AsyncTeleBot(token)
+        self.bot = LoopBot(self.async_bot, self.loop)
+        self.dispatcher = AsyncDispatcher(process, accept=accept)
+
+    async def poll_updates(self, timeout=20):
+        # Same contract as the sync poll_updates: a full dispatcher slows
+        # polling down instead of dropping updates
+        offset = None
+        while True:
+            try:
+                updates = await self.async_bot.get_updates(offset=offset, timeout=timeout, request_timeout=timeout + 10)
+            except Exception as e:
+                print(f"Failed to get updates: {e}")
+                await asyncio.sleep(3)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.dispatcher.admit(update)
+
+    async def serve(self, mode, webhook_url=None, secret=None):
+        self.dispatcher.start(self.loop)
+        # Polling fails while a webhook is registered, e.g. after switching modes
+        await self.async_bot.remove_webhook()
+        try:
+            if mode == 'webhook':
+                await self.async_bot.set_webhook(url=webhook_url, secret_token=secret)
+                # Updates arrive through the web server thread's submit()
+                await asyncio.Event().wait()
+            else:
+                await self.poll_updates()
+        finally:
+            await self.async_bot.close_session()
+
+    def run(self, mode, webhook_url=None, secret=None):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.serve(mode, webhook_url, secret))
@@ -0,0 +1,123 @@
+import threading
+from datetime import date
+
+# Bookable hours are 06:00-22:00 over today plus the next 7 days
+OPEN_HOUR = 6
+CLOSE_HOUR = 22
+BOOKING_DAYS = 7
+# Slots starting sooner than this can't be booked (or offered) any more
+BOOKING_CUTOFF_SECONDS = 5 * 60
+# Standing bookings (series) reach further ahead; the index covers them too
+SERIES_MAX_WEEKS = 26
+INDEX_DAYS = max(BOOKING_DAYS + 1, SERIES_MAX_WEEKS * 7 + 1)
+OPEN_HOURS_MASK = sum(1 << hour for hour in range(OPEN_HOUR, CLOSE_HOUR))
+
+# Court used for reservations made before courts existed
+DEFAULT_COURT = 1
+
+def mask_hours(mask):
+    return [hour for hour in range(OPEN_HOUR, CLOSE_HOUR) if mask >> hour & 1]
+
+def not_before_mask(day, not_before):
+    # Bits of the hours on `day` that still start at or after not_before
+    if not_before is None or day > not_before.date():
+        return OPEN_HOURS_MASK
+    if day < not_before.date():
+        return 0
+    first_hour = not_before.hour + (1 if (not_before.minute or not_before.second) else 0)
+    return OPEN_HOURS_MASK & ~((1 << first_hour) - 1)
+
+class AvailabilityIndex:
+    # Bitmask of reserved hours (bit h set = h:00 is taken) per (date ordinal,
+    # court). Loaded once from the reservations table and then kept in sync by
+    # the db write helpers, so lookups never touch SQLite. Questions across
+    # courts ("is any court free at 18:00?") are bitwise ops over the masks.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reserved = {}
+        self._first_day = date.today().toordinal()
+        self.courts = (DEFAULT_COURT,)
+        # Bumped on every change, so callers can cache anything derived from the index
+        self.version = 0
+
+    def load(self, masks, courts=None, today=None):
+        # masks: (date ordinal, court id, reserved mask) rows
+        first_day = (today or date.today()).toordinal()
+        reserved = {}
+        for day, court, mask in masks:
+            if day >= first_day and mask:
+                reserved[day, court] = reserved.get((day, court), 0) | mask
+        with self._lock:
+            self._reserved = reserved
+            self._first_day = first_day
+            if courts:
+                self.courts = tuple(courts)
+            self.version += 1
+
+    def mark_reserved(self, slot, court=DEFAULT_COURT):
+        with self._lock:
+            key = (slot // 24, court)
+            self._reserved[key] = self._reserved.get(key, 0) | 1 << (slot % 24)
+            self.version += 1
+
+    def mark_free(self, slot, court=DEFAULT_COURT):
+        with self._lock:
+            key = (slot // 24, court)
+            mask = self._reserved.get(key, 0) & ~(1 << (slot % 24))
+            if mask:
+                self._reserved[key] = mask
+            else:
+                self._reserved.pop(key, None)
+            self.version += 1
+
+    def _drop_past_days(self, first_day):
+        # Called under the lock; keeps the dict bounded to the booking window
+        if first_day > self._first_day:
+            self._reserved = {key: mask for key, mask in self._reserved.items() if key[0] >= first_day}
+            self._first_day = first_day
+
+    def free_masks(self, day, not_before=None):
+        # {court: mask of bookable free hours} for one day
+        ordinal = day.toordinal()
+        bookable = not_before_mask(day, not_before)
+        with self._lock:
+            self._drop_past_days(date.today().toordinal())
+            return {court: bookable & ~self._reserved.get((ordinal, court), 0) for court in self.courts}
+
+    def matrix(self, first_day, days, not_before=None):
+        # days x courts x hours: {date ordinal: {court: free hours mask}}
+        ordinal = first_day.toordinal()
+        return {
+            ordinal + offset: self.free_masks(date.fromordinal(ordinal + offset), not_before)
+            for offset in range(days)
+        }
+
+    def free_hours(self, day, not_before=None):
+        # Hours with at least one free court
+        free = 0
+        for mask in self.free_masks(day, not_before).values():
+            free |= mask
+        return mask_hours(free)
+
+    def free_courts(self, day, hour, not_before=None):
+        return [court for court, mask in self.free_masks(day, not_before).items() if mask >> hour & 1]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._reserved)
+
+    def diff(self, masks, today=None):
+        # Compare against masks computed from the table and return
+        # {(date ordinal, court): (index mask, table mask)} wherever they disagree
+        expected = AvailabilityIndex()
+        expected.load(masks, today=today)
+        actual = {key: mask for key, mask in self.snapshot().items() if key[0] >= expected._first_day}
+        expected = expected.snapshot()
+        return {
+            key: (actual.get(key, 0), expected.get(key, 0))
+            for key in set(actual) | set(expected)
+            if actual.get(key, 0) != expected.get(key, 0)
+        }
+
+# Process-wide index shared by every handler thread
+availability_index = AvailabilityIndex()
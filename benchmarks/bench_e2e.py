@@ -0,0 +1,382 @@
+# End-to-end load benchmark. Starts a local stand-in for the Telegram Bot API,
+# points TeleBot at it and runs the real bot (telegrambot.py) against a
+# throwaway database. Synthetic users go through /start -> /reserve -> date
+# callback -> time button -> /cancel; each sends its next update as soon as
+# the bot has answered the previous one. Latency is measured at the fake API,
+# from handing an update out in getUpdates to the reply that ends the step,
+# so it covers dispatch, handler, DB and the outbox.
+#
+# Runs offline. Prints JSON (or writes it with --output) so runs can be diffed:
+#   python benchmarks/bench_e2e.py --users 2000 --concurrency 100 --output before.json
+import argparse
+import collections
+import json
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = '123456:BENCHMARK'
+STEPS = ['start', 'reserve', 'date', 'time', 'cancel']
+# Replies that always have a follow-up message in the same step
+LEAD_IN_PREFIXES = ('Welcome', 'Congratulations')
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+class FakeBotAPI:
+    # Bot API methods the bot uses, plus the user simulation: every reply the
+    # bot sends decides what the synthetic user sends next
+    def __init__(self, users, concurrency, seed=1):
+        self.users = users
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        self.lock = threading.Condition()
+        self.pending = collections.deque()
+        self.update_id = 0
+        self.message_id = 0
+        self.next_user = 0
+        self.finished_users = 0
+        self.state = {}
+        self.photo_started = {}
+        self.latency = collections.defaultdict(list)
+        self.card_latency = []
+        self.calls = collections.Counter()
+        self.updates_delivered = 0
+        self.done = threading.Event()
+
+    # --- simulation -------------------------------------------------------
+
+    def start_users(self):
+        with self.lock:
+            for _ in range(min(self.concurrency, self.users)):
+                self._new_user()
+
+    def _new_user(self):
+        # Called with the lock held
+        self.next_user += 1
+        user_id = 10_000_000 + self.next_user
+        self.state[user_id] = {'step': 'start', 'delivered': None}
+        self._enqueue(user_id, 'start', '/start')
+
+    def _enqueue(self, user_id, step, text=None, data=None):
+        self.update_id += 1
+        self.message_id += 1
+        sender = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'last_name': 'Bench'}
+        chat = {'id': user_id, 'type': 'private'}
+        message = {'message_id': self.message_id, 'date': int(time.time()), 'chat': chat, 'from': sender}
+        if data is None:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+            update = {'update_id': self.update_id, 'message': message}
+        else:
+            message['from'] = {'id': 1, 'is_bot': True, 'first_name': 'Bot'}
+            message['text'] = 'Please select the date you want to play:'
+            update = {'update_id': self.update_id, 'callback_query': {
+                'id': str(self.update_id), 'from': sender, 'chat_instance': str(user_id),
+                'message': message, 'data': data,
+            }}
+        self.state[user_id].update(step=step, delivered=None)
+        self.pending.append((user_id, update))
+        self.lock.notify_all()
+
+    def _advance(self, user_id, reply_markup):
+        # Called with the lock held when the bot finished answering a step
+        state = self.state[user_id]
+        step = state['step']
+        self.latency[step].append(time.perf_counter() - state['delivered'])
+        markup = json.loads(reply_markup) if reply_markup else {}
+        if step == 'start':
+            self._enqueue(user_id, 'reserve', '/reserve')
+        elif step == 'reserve' and markup.get('inline_keyboard'):
+            button = self.random.choice([row[0] for row in markup['inline_keyboard']])
+            self._enqueue(user_id, 'date', data=button['callback_data'])
+        elif step == 'date' and markup.get('keyboard'):
+            button = self.random.choice([button for row in markup['keyboard'] for button in row])
+            self.photo_started[user_id] = time.perf_counter()
+            self._enqueue(user_id, 'time', button['text'])
+        elif step != 'cancel':
+            # Fully booked or lost the race: still cancel, like a real user would
+            self._enqueue(user_id, 'cancel', '/cancel')
+        else:
+            del self.state[user_id]
+            self.finished_users += 1
+            if self.next_user < self.users:
+                self._new_user()
+            elif self.finished_users == self.users:
+                self.done.set()
+
+    def on_message(self, chat_id, text, reply_markup):
+        with self.lock:
+            state = self.state.get(chat_id)
+            if state is None or state['delivered'] is None:
+                return
+            if reply_markup is None and text.startswith(LEAD_IN_PREFIXES):
+                return
+            self._advance(chat_id, reply_markup)
+
+    def on_photo(self, chat_id):
+        with self.lock:
+            started = self.photo_started.pop(chat_id, None)
+            if started is not None:
+                self.card_latency.append(time.perf_counter() - started)
+
+    def take_updates(self, offset, timeout, limit=100):
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while not self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.lock.wait(remaining)
+            batch = []
+            now = time.perf_counter()
+            while self.pending and len(batch) < limit:
+                user_id, update = self.pending.popleft()
+                if user_id in self.state:
+                    self.state[user_id]['delivered'] = now
+                batch.append(update)
+            self.updates_delivered += len(batch)
+            return batch
+
+    # --- HTTP -------------------------------------------------------------
+
+    def make_handler(api):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; without this,
+                # Nagle plus delayed ACKs add ~40ms to every call
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_call()
+
+            def do_POST(self):
+                self.handle_call()
+
+            def handle_call(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                url = urlsplit(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                # The sync client sends parameters in the query string, the
+                # async one as a form body (multipart when uploading a file)
+                params = dict(parse_qsl(url.query))
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+                elif content_type.startswith('multipart/form-data'):
+                    chat_id = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body)
+                    if chat_id:
+                        params['chat_id'] = chat_id.group(1).decode()
+                api.calls[method] += 1
+                self.reply(api.dispatch(method, params))
+
+            def reply(self, result):
+                body = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        return Handler
+
+    def _sent_message(self, chat_id, **fields):
+        with self.lock:
+            self.message_id += 1
+            message_id = self.message_id
+        return dict({'message_id': message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}}, **fields)
+
+    def dispatch(self, method, params):
+        if method == 'getUpdates':
+            return self.take_updates(int(params.get('offset', 0)), float(params.get('timeout', 0)))
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            self.on_message(chat_id, params.get('text', ''), params.get('reply_markup'))
+            return self._sent_message(chat_id, text=params.get('text', ''))
+        if method == 'sendPhoto':
+            chat_id = int(params['chat_id'])
+            self.on_photo(chat_id)
+            return self._sent_message(chat_id, photo=[{'file_id': 'card', 'file_unique_id': 'card', 'width': 1, 'height': 1}])
+        if method == 'sendLocation':
+            chat_id = int(params['chat_id'])
+            return self._sent_message(chat_id, location={'latitude': 0.0, 'longitude': 0.0})
+        if method == 'getChat':
+            chat_id = int(params['chat_id'])
+            return {'id': chat_id, 'type': 'private', 'first_name': f'User{chat_id}', 'last_name': 'Bench'}
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'bench_bot'}
+        # answerCallbackQuery, deleteWebhook, ...
+        return True
+
+class Timings:
+    # Wall time spent inside pooled DB connections, per checkout
+    def __init__(self):
+        self.samples = []
+
+    def instrument_pool(self):
+        from db_pool import ConnectionPool
+        checkout = ConnectionPool.connection
+        samples = self.samples
+
+        @contextmanager
+        def timed_connection(pool):
+            started = time.perf_counter()
+            try:
+                with checkout(pool) as connection:
+                    yield connection
+            finally:
+                samples.append(time.perf_counter() - started)
+        ConnectionPool.connection = timed_connection
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load benchmark against a fake Bot API')
+    parser.add_argument('--users', type=int, default=2000, help='synthetic users, each runs the flow once')
+    parser.add_argument('--concurrency', type=int, default=100, help='users in the flow at the same time')
+    parser.add_argument('--runtime', choices=['sync', 'async'], default='sync', help='BOT_RUNTIME of the bot under test')
+    parser.add_argument('--telegram-limits', action='store_true', help="keep the outbox's real rate limits")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600, help='give up after this many seconds')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    os.environ.update({
+        'tg_key': TOKEN,
+        'BOT_MODE': 'polling',
+        'BOT_RUNTIME': args.runtime,
+        # Synthetic users answer as fast as the bot does; don't rate-limit them
+        'ADMISSION_USER_RATE': '1000000',
+        'ADMISSION_USER_BURST': '1000',
+        'DB_DIR': workdir,
+        'JOURNAL_PATH': os.path.join(workdir, 'reservations.jsonl'),
+    })
+    if not args.telegram_limits:
+        # Measure the bot, not Telegram's flood limits
+        os.environ.setdefault('OUTBOX_GLOBAL_RATE', '1000000')
+        os.environ.setdefault('OUTBOX_CHAT_RATE', '1000000')
+        os.environ.setdefault('OUTBOX_CHAT_BURST', '1000')
+    os.chdir(ROOT)
+
+    api = FakeBotAPI(args.users, args.concurrency, args.seed)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.make_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-bot-api', daemon=True).start()
+
+    from telebot import apihelper
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_address[1]}/bot{{0}}/{{1}}"
+    if args.runtime == 'async':
+        from telebot import asyncio_helper
+        asyncio_helper.API_URL = apihelper.API_URL
+
+    timings = Timings()
+    timings.instrument_pool()
+
+    # Anything the bot prints goes to stderr so stdout stays valid JSON
+    results_stream, sys.stdout = sys.stdout, sys.stderr
+
+    import telegrambot as bot_module
+    startup = bot_module.create_app()
+    # run() polls forever
+    threading.Thread(target=bot_module.run, name='bot', daemon=True).start()
+    waited = time.perf_counter()
+    while api.calls['getUpdates'] == 0:
+        if time.perf_counter() - waited > 60:
+            sys.exit("Bot did not start polling within 60 seconds")
+        time.sleep(0.01)
+
+    timings.samples.clear()
+    started = time.perf_counter()
+    api.start_users()
+    completed = api.done.wait(args.timeout)
+    elapsed = time.perf_counter() - started
+    # Let cards that are still rendering or queued for sending arrive
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        render = bot_module.image_pipeline.stats()
+        if not (render['in_flight'] + render['queue_depth'] + bot_module.outbox.stats()['queue_depth']):
+            break
+        time.sleep(0.05)
+
+    render = bot_module.image_pipeline.stats()
+    dispatch = bot_module.dispatcher.stats()
+    if args.runtime == 'sync':
+        dispatch = {
+            'shards': len(dispatch),
+            'processed': sum(shard['processed'] for shard in dispatch),
+            'failed': sum(shard['failed'] for shard in dispatch),
+            'busy_seconds': round(sum(shard['busy_seconds'] for shard in dispatch), 3),
+            'max_ms': round(max(shard['max_seconds'] for shard in dispatch) * 1000, 3),
+        }
+    results = {
+        'config': {
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'runtime': args.runtime,
+            'telegram_limits': args.telegram_limits,
+            'seed': args.seed,
+            'card_workers': render['workers'],
+        },
+        'completed': completed,
+        'users_finished': api.finished_users,
+        'startup_seconds': {phase: round(seconds, 4) for phase, seconds in startup.items()},
+        'elapsed_seconds': round(elapsed, 3),
+        'updates': api.updates_delivered,
+        'updates_per_second': round(api.updates_delivered / elapsed, 1) if elapsed else 0.0,
+        'steps': {step: percentiles(api.latency[step]) for step in STEPS},
+        'db': dict(percentiles(timings.samples), total_seconds=round(sum(timings.samples), 3)),
+        'render': {
+            'rendered': render['rendered'],
+            'failed': render['failed'],
+            'rejected': render['rejected'],
+            'avg_ms': round(render['render_seconds_avg'] * 1000, 3),
+            'max_ms': round(render['render_seconds_max'] * 1000, 3),
+            'card_delivery': percentiles(api.card_latency),
+        },
+        'dispatch': dispatch,
+        'outbox': bot_module.outbox.stats(),
+        'api_calls': dict(api.calls),
+    }
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        results_stream.write(output + '\n')
+    results_stream.flush()
+    # Forked render workers would otherwise outlive us holding stdout open
+    bot_module.image_pipeline.shutdown()
+    # The bot's polling, Flask and worker threads never return on their own
+    os._exit(0 if completed else 1)
+
+if __name__ == '__main__':
+    main()
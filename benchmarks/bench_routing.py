@@ -0,0 +1,71 @@
+# Micro-benchmark: cost of routing one text update to its handler.
+# Compares the old telebot-style filter chain (commands checked handler by
+# handler, then a lambda rebuilding "HH:MM" strings from the user's slots)
+# against TextRouter with the bot's own slot matcher, telegrambot.is_slot_choice,
+# looking users up in a MemoryConversationStore.
+# Run with: python benchmarks/bench_routing.py
+import os
+import sys
+import timeit
+from datetime import datetime as dt, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telegrambot as app
+from availability import OPEN_HOURS_MASK, DEFAULT_COURT
+from conversations import ANY_COURT, MemoryConversationStore, SlotChoices
+from routing import TextRouter
+
+COMMANDS = ['start', 'support', 'location', 'reserve', 'cancel']
+
+def make_message(user_id, text):
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=user_id))
+
+def build_legacy(users):
+    # Mirrors the old handler list: datetime slots per user and a filter chain
+    start = dt(2024, 1, 1, 6)
+    slots = {user_id: {'slots': [start + timedelta(hours=h) for h in range(16)]} for user_id in range(users)}
+    handlers = [({'commands': [name]}, name) for name in COMMANDS]
+    handlers.append(({'func': lambda m: m.text and m.text in [s.strftime('%H:%M') for s in slots.get(m.from_user.id, {}).get('slots', [])]}, 'slot'))
+    handlers.append(({}, 'text'))
+
+    def route(message):
+        for filters, name in handlers:
+            if 'commands' in filters:
+                if not message.text.startswith('/') or message.text.split()[0].split('@')[0][1:] not in filters['commands']:
+                    continue
+            if 'func' in filters and not filters['func'](message):
+                continue
+            return name
+    return route
+
+def build_router(users):
+    router = TextRouter()
+    for name in COMMANDS:
+        router.command(name)(name)
+    # Every user holds a one-court keyboard with every opening hour offered
+    app.courts = {DEFAULT_COURT: 'Court 1'}
+    app.conversations = MemoryConversationStore(max_size=users)
+    choices = SlotChoices(dt(2024, 1, 1).toordinal(), ((ANY_COURT, OPEN_HOURS_MASK),))
+    for user_id in range(users):
+        app.conversations.put(user_id, choices)
+    router.slot_selection(app.is_slot_choice)('slot')
+    router.default('text')
+    return router.route
+
+def main():
+    users = 10000
+    messages = [
+        make_message(42, '/cancel'),
+        make_message(42, '18:00'),
+        make_message(42, 'hello there'),
+    ]
+    number = 100000
+    for label, route in (('legacy filter chain', build_legacy(users)), ('TextRouter', build_router(users))):
+        for message in messages:
+            seconds = min(timeit.repeat(lambda: route(message), number=number, repeat=5))
+            print(f"{label:20} {message.text!r:15} {seconds / number * 1e9:8.0f} ns/update")
+
+if __name__ == '__main__':
+    main()
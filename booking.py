@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import namedtuple
+
+from datetime import date, timedelta
+
+from availability import availability_index, not_before_mask, OPEN_HOURS_MASK, SERIES_MAX_WEEKS, INDEX_DAYS, OPEN_HOUR, CLOSE_HOUR
+from db import save_reservation_to_db, save_series_to_db, get_slot_holder, get_user_reservation, slot_date, slot_hour
+
+# Outcomes of book_slot
+Booked = namedtuple('Booked', 'slot court_id')
+SlotTaken = namedtuple('SlotTaken', 'slot court_id')
+AlreadyBooked = namedtuple('AlreadyBooked', 'slot court_id')
+
+# Outcomes of book_series. conflicts holds one (slot, reason) per occurrence
+# that can't be booked; reason is 'closed', 'past', 'held' or 'taken'.
+SeriesBooked = namedtuple('SeriesBooked', 'series_id slots court_id')
+SeriesConflict = namedtuple('SeriesConflict', 'slots court_id conflicts')
+
+class SlotHolds:
+    # Slots reserved for one user for a short while (a waitlist offer). Only
+    # that user can book a held (slot, court) until the hold expires.
+    def __init__(self):
+        self._holds = {}
+        self._lock = threading.Lock()
+        # Bumped on every hold and release, like AvailabilityIndex.version
+        self.version = 0
+
+    def hold(self, slot, court_id, user_id, until):
+        with self._lock:
+            self._holds[slot, court_id] = (user_id, until)
+            self.version += 1
+
+    def release(self, slot, court_id, user_id=None):
+        # With user_id, only that user's hold is released; True if one was
+        with self._lock:
+            held = self._holds.get((slot, court_id))
+            if held is None or user_id is not None and held[0] != user_id:
+                return False
+            del self._holds[slot, court_id]
+            self.version += 1
+            return True
+
+    def holder(self, slot, court_id):
+        held = self._holds.get((slot, court_id))
+        if held is None or held[1] <= time.time():
+            return None
+        return held[0]
+
+    def held_masks(self, day, except_user=None):
+        # {court: mask of hours on date ordinal `day` held for someone else}
+        masks = {}
+        now = time.time()
+        with self._lock:
+            for (slot, court_id), (user_id, until) in self._holds.items():
+                if slot // 24 == day and until > now and user_id != except_user:
+                    masks[court_id] = masks.get(court_id, 0) | 1 << (slot % 24)
+        return masks
+
+# Process-wide holds shared by every handler thread
+slot_holds = SlotHolds()
+
+def book_slot(user_id, slot, court_id=None):
+    # The INSERT itself decides who wins a race for the slot, so concurrent
+    # handlers need no lock; the loser is offered the day's keyboard again.
+    # Without a court_id the first court the index reports free is taken.
+    if court_id is not None:
+        courts = [court_id]
+    else:
+        courts = availability_index.free_courts(slot_date(slot), slot_hour(slot))
+    for court in courts:
+        if slot_holds.holder(slot, court) not in (None, user_id):
+            continue
+        for _ in range(2):
+            if save_reservation_to_db(user_id, slot, court):
+                return Booked(slot, court)
+            existing = get_user_reservation(user_id)
+            if existing is not None:
+                return AlreadyBooked(*existing)
+            if get_slot_holder(slot, court) is not None:
+                # Make sure the index agrees before the keyboard is rebuilt from it
+                availability_index.mark_reserved(slot, court)
+                break
+            # The conflicting row was deleted in between; try the claim once more
+    return SlotTaken(slot, court_id)
+
+def series_slots(first_slot, weeks=1, hours=1, today=None):
+    # "Tuesdays 19:00 for 10 weeks, 2 hours each": every hour of every week.
+    # Each occurrence must end by closing time and the last week must still
+    # be inside the availability index, which the conflict check relies on.
+    start_hour = slot_hour(first_slot)
+    if not OPEN_HOUR <= start_hour < CLOSE_HOUR:
+        raise ValueError(f"the start time must be between {OPEN_HOUR:02d}:00 and {CLOSE_HOUR - 1:02d}:00")
+    if not 1 <= weeks <= SERIES_MAX_WEEKS:
+        raise ValueError(f"weeks must be between 1 and {SERIES_MAX_WEEKS}")
+    if not 1 <= hours <= CLOSE_HOUR - start_hour:
+        raise ValueError(f"hours must be between 1 and {CLOSE_HOUR - start_hour} for a {start_hour:02d}:00 start")
+    today = today or date.today()
+    first_day = slot_date(first_slot)
+    last_day = first_day + timedelta(weeks=weeks - 1)
+    if first_day < today:
+        raise ValueError("the start date is in the past")
+    if last_day >= today + timedelta(days=INDEX_DAYS):
+        raise ValueError(f"the last week must start before {today + timedelta(days=INDEX_DAYS):%Y-%m-%d}")
+    return [first_slot + week * 7 * 24 + hour for week in range(weeks) for hour in range(hours)]
+
+def _series_conflicts(user_id, slots, court_id, not_before):
+    # Checks that need no database: opening hours, start time, waitlist holds
+    # and the availability index. The INSERT transaction has the final word.
+    conflicts = []
+    free = {}
+    for slot in slots:
+        day = slot_date(slot)
+        if day not in free:
+            free[day] = availability_index.free_masks(day, not_before).get(court_id, 0)
+        if not OPEN_HOURS_MASK >> slot_hour(slot) & 1:
+            conflicts.append((slot, 'closed'))
+        elif not not_before_mask(day, not_before) >> slot_hour(slot) & 1:
+            conflicts.append((slot, 'past'))
+        elif slot_holds.holder(slot, court_id) not in (None, user_id):
+            conflicts.append((slot, 'held'))
+        elif not free[day] >> slot_hour(slot) & 1:
+            conflicts.append((slot, 'taken'))
+    return conflicts
+
+def book_series(user_id, slots, court_id=None, not_before=None):
+    # Books every slot on one court or none of them. Without a court_id the
+    # courts are tried in order; the conflict report is the first court's.
+    courts = [court_id] if court_id is not None else list(availability_index.courts)
+    report = None
+    for court in courts:
+        conflicts = _series_conflicts(user_id, slots, court, not_before)
+        if not conflicts:
+            series_id, taken = save_series_to_db(user_id, [(slot, court) for slot in slots])
+            if series_id is not None:
+                return SeriesBooked(series_id, slots, court)
+            conflicts = [(slot, 'taken') for slot, _, _ in taken]
+        if report is None:
+            report = SeriesConflict(slots, court, conflicts)
+    return report
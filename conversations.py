@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from db import save_conversation, get_conversation, delete_conversation, purge_conversations, count_conversations
+
+# Court id meaning "whichever court is free", used when there is only one
+ANY_COURT = 0
+
+# The time keyboard a user is choosing from: a date ordinal plus, per court,
+# a bitmask of the hours offered (bit h set = h:00). A few dozen bytes per
+# user instead of a list of datetimes.
+SlotChoices = namedtuple('SlotChoices', 'day masks')
+
+def encode_masks(masks):
+    # ((court, mask), ...) -> "court:mask,court:mask"
+    return ','.join(f'{court}:{mask}' for court, mask in masks)
+
+def decode_masks(text):
+    if not text:
+        return ()
+    return tuple(tuple(int(part) for part in pair.split(':')) for pair in text.split(','))
+
+class MemoryConversationStore:
+    # Per-process LRU of SlotChoices with an idle TTL: every put() renews the
+    # entry, and entries nobody touched for `ttl` seconds (users who left the
+    # flow halfway) are dropped, as is the least recent one beyond max_size.
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl or float(os.getenv('CONVERSATION_TTL', '1800'))
+        self.max_size = max_size or int(os.getenv('CONVERSATION_MAX_SIZE', '10000'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[user_id]
+                self.evicted += 1
+                return None
+            return entry[1]
+
+    def put(self, user_id, choices):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, choices)
+            self._entries.move_to_end(user_id)
+            # Oldest first: with one TTL for everyone, expired entries sit at the front
+            while self._entries:
+                expires, _ = next(iter(self._entries.values()))
+                if expires > now and len(self._entries) <= self.max_size:
+                    break
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteConversationStore:
+    # Same interface, backed by the conversations table, so a user's open
+    # time keyboard survives a restart or redeploy. It is not a way to run
+    # several bot processes: the rest of the state is per process, and
+    # lock_database() allows one process per file. Expiry uses wall-clock
+    # time because it is compared across restarts.
+    def __init__(self, ttl=None, max_size=None, purge_interval=60):
+        self.ttl = ttl or float(os.getenv('CONVERSATION_TTL', '1800'))
+        self.max_size = max_size or int(os.getenv('CONVERSATION_MAX_SIZE', '10000'))
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, user_id):
+        row = get_conversation(user_id, time.time())
+        return SlotChoices(row[0], decode_masks(row[1])) if row else None
+
+    def put(self, user_id, choices):
+        now = time.time()
+        save_conversation(user_id, choices.day, encode_masks(choices.masks), now + self.ttl)
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        self.evicted += purge_conversations(now, self.max_size)
+
+    def discard(self, user_id):
+        delete_conversation(user_id)
+
+    def __len__(self):
+        return count_conversations(time.time())
+
+def create_conversation_store(backend=None):
+    # CONVERSATION_STORE=memory (default) or sqlite
+    backend = backend or os.getenv('CONVERSATION_STORE', 'memory')
+    if backend == 'memory':
+        return MemoryConversationStore()
+    if backend == 'sqlite':
+        return SQLiteConversationStore()
+    raise ValueError(f"Unknown conversation store: {backend}")
@@ -0,0 +1,663 @@
+import atexit
+import os
+try:
+    import fcntl
+except ImportError:
+    # Windows: no advisory locks, so lock_database() can't enforce anything
+    fcntl = None
+import threading
+import time
+from datetime import datetime as dt, date
+from availability import availability_index, INDEX_DAYS, DEFAULT_COURT
+from db_pool import ConnectionPool, retry_on_busy
+from metrics import timed_query
+
+# Directory for the SQLite database (persistent disk on Render)
+DB_DIR = os.getenv('DB_DIR', '/opt/render/project/src/data')
+DB_PATH = os.path.join(DB_DIR, 'tennis_court_reservation.db')
+
+# Shared connection pool, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+# Open lock file of lock_database(), kept for the life of the process
+_process_lock = None
+
+# A slot is the number of hours since 0001-01-01 00:00 in court-local wall time,
+# so every day is the half-open key range [day * 24, day * 24 + 24)
+def slot_key(day, hour):
+    return day.toordinal() * 24 + hour
+
+def slot_date(slot):
+    return date.fromordinal(slot // 24)
+
+def slot_hour(slot):
+    return slot % 24
+
+def slot_datetime(slot):
+    return dt.combine(slot_date(slot), dt.min.time()).replace(hour=slot_hour(slot))
+
+def day_range(day, days=1):
+    start = slot_key(day, 0)
+    return start, start + 24 * days
+
+def format_slot(slot):
+    return slot_datetime(slot).strftime('%Y-%m-%d %H:%M')
+
+def parse_slot(text):
+    parsed = dt.strptime(text, '%Y-%m-%d %H:%M')
+    return slot_key(parsed.date(), parsed.hour)
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                os.makedirs(DB_DIR, exist_ok=True)
+                pool = ConnectionPool(DB_PATH, on_first_connect=create_reservations_table)
+                atexit.register(pool.close)
+                _pool = pool
+    return _pool
+
+def db_connection():
+    # Context manager: pooled connection, committed on success, rolled back on error
+    return get_pool().connection()
+
+def lock_database():
+    # One bot process per database file. Only conversations (with
+    # CONVERSATION_STORE=sqlite) are read back from SQLite on every update;
+    # the availability index, slot holds, reminders and waitlist offers are
+    # loaded once and then kept in this process's memory, so a second process
+    # would double-book and double-send. Raises RuntimeError if one is running.
+    global _process_lock
+    if _process_lock is not None or fcntl is None:
+        return
+    os.makedirs(DB_DIR, exist_ok=True)
+    lock_file = open(DB_PATH + '.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(f"Another bot process is using {DB_PATH}; only one may run per database file")
+    _process_lock = lock_file
+
+def _schema_v1(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reservations (
+            user_id INTEGER PRIMARY KEY,
+            reservation_time TEXT
+        )
+    ''')
+
+def _migrated_v1_rows(cursor):
+    for user_id, reservation_time in cursor.execute("SELECT user_id, reservation_time FROM reservations_v1"):
+        try:
+            yield user_id, parse_slot(reservation_time)
+        except (TypeError, ValueError):
+            print(f"Dropping unparseable reservation for user_id {user_id}: {reservation_time!r}")
+
+def _schema_v2(cursor):
+    # Replace the TEXT timestamp with the numeric slot key. Rows are parsed once
+    # here, streamed from the old table so a long history is never held in memory.
+    cursor.execute("ALTER TABLE reservations RENAME TO reservations_v1")
+    cursor.execute('''
+        CREATE TABLE reservations (
+            user_id INTEGER PRIMARY KEY,
+            slot INTEGER NOT NULL
+        )
+    ''')
+    cursor.connection.cursor().executemany(
+        "INSERT INTO reservations (user_id, slot) VALUES (?, ?)",
+        _migrated_v1_rows(cursor.connection.cursor())
+    )
+    cursor.execute("DROP TABLE reservations_v1")
+    # Covers "slots on day D" range scans; "reservation of user U" is the rowid lookup
+    cursor.execute("CREATE INDEX reservations_by_slot ON reservations (slot, user_id)")
+
+def _schema_v3(cursor):
+    # Telegram profiles, so the user cache starts warm after a restart
+    cursor.execute('''
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX users_by_updated_at ON users (updated_at)")
+
+def _schema_v4(cursor):
+    # One reservation per slot, enforced by the database. Older rows were never
+    # checked for this, so keep the first booking of any double-booked slot and
+    # move the others to reservations_conflicts, where they can be recovered.
+    cursor.execute('''
+        CREATE TABLE reservations_conflicts (
+            user_id INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            removed_at INTEGER NOT NULL
+        )
+    ''')
+    duplicates = "rowid NOT IN (SELECT MIN(rowid) FROM reservations GROUP BY slot)"
+    cursor.execute(
+        f"INSERT INTO reservations_conflicts (user_id, slot, removed_at) SELECT user_id, slot, ? FROM reservations WHERE {duplicates}",
+        (int(time.time()),)
+    )
+    cursor.execute(f"DELETE FROM reservations WHERE {duplicates}")
+    if cursor.rowcount:
+        print(f"Moved {cursor.rowcount} double-booked reservation(s) to reservations_conflicts")
+    cursor.execute("DROP INDEX reservations_by_slot")
+    # Still covering for day range scans: the index stores the rowid (user_id)
+    cursor.execute("CREATE UNIQUE INDEX reservations_by_slot ON reservations (slot)")
+
+def _schema_v5(cursor):
+    # Past reservations move here so the live table only holds upcoming ones
+    cursor.execute('''
+        CREATE TABLE reservations_archive (
+            user_id INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX reservations_archive_by_slot ON reservations_archive (slot)")
+    cursor.execute("CREATE INDEX reservations_archive_by_user ON reservations_archive (user_id, slot)")
+
+def _schema_v6(cursor):
+    # Several courts: every reservation belongs to one, slots are unique per court
+    cursor.execute('''
+        CREATE TABLE courts (
+            court_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    cursor.execute("INSERT INTO courts (court_id, name) VALUES (?, 'Court 1')", (DEFAULT_COURT,))
+    cursor.execute(f"ALTER TABLE reservations ADD COLUMN court_id INTEGER NOT NULL DEFAULT {DEFAULT_COURT}")
+    cursor.execute(f"ALTER TABLE reservations_archive ADD COLUMN court_id INTEGER NOT NULL DEFAULT {DEFAULT_COURT}")
+    cursor.execute("DROP INDEX reservations_by_slot")
+    cursor.execute("CREATE UNIQUE INDEX reservations_by_slot ON reservations (slot, court_id)")
+
+def _schema_v7(cursor):
+    # In-flight conversations (the time keyboard a user is choosing from),
+    # kept across restarts
+    cursor.execute('''
+        CREATE TABLE conversations (
+            user_id INTEGER PRIMARY KEY,
+            day INTEGER NOT NULL,
+            masks TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX conversations_by_expiry ON conversations (expires_at)")
+
+def _schema_v8(cursor):
+    # Running booking/cancellation counts per hour of day, weekday, month and
+    # court, bumped in the same transaction as each booking or cancellation.
+    # Reservations made before this existed are counted once here.
+    cursor.execute('''
+        CREATE TABLE utilization (
+            dimension TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0,
+            canceled INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, bucket)
+        ) WITHOUT ROWID
+    ''')
+    for table in ('reservations', 'reservations_archive'):
+        grouped = cursor.execute(f"SELECT slot, court_id, COUNT(*) FROM {table} GROUP BY slot, court_id").fetchall()
+        for slot, court_id, count in grouped:
+            _count_utilization(cursor, slot, court_id, 'booked', count)
+
+def _schema_v9(cursor):
+    # Set once the reminder for a reservation has been sent, so a restart
+    # neither repeats nor loses reminders
+    cursor.execute("ALTER TABLE reservations ADD COLUMN reminded INTEGER NOT NULL DEFAULT 0")
+
+def _schema_v10(cursor):
+    # Users waiting for a full hour (hour = -1: any hour of the day), served
+    # first come first served. offered_* is set while a freed slot is held
+    # for the entry's user.
+    cursor.execute('''
+        CREATE TABLE waitlist (
+            entry_id INTEGER PRIMARY KEY,
+            day INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            offered_slot INTEGER,
+            offered_court INTEGER,
+            offered_until REAL
+        )
+    ''')
+    cursor.execute("CREATE INDEX waitlist_by_hour ON waitlist (day, hour, entry_id)")
+    cursor.execute("CREATE UNIQUE INDEX waitlist_by_user ON waitlist (user_id, day, hour)")
+
+def _schema_v11(cursor):
+    # Standing bookings: a series owns any number of reservations, so user_id
+    # stops being the key. Ordinary bookings (series_id NULL) stay limited to
+    # one per user through a partial unique index.
+    cursor.execute('''
+        CREATE TABLE reservation_series (
+            series_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX reservation_series_by_user ON reservation_series (user_id)")
+    cursor.execute("ALTER TABLE reservations RENAME TO reservations_v10")
+    cursor.execute(f'''
+        CREATE TABLE reservations (
+            reservation_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            court_id INTEGER NOT NULL DEFAULT {DEFAULT_COURT},
+            reminded INTEGER NOT NULL DEFAULT 0,
+            series_id INTEGER
+        )
+    ''')
+    cursor.execute(
+        "INSERT INTO reservations (user_id, slot, court_id, reminded) "
+        "SELECT user_id, slot, court_id, reminded FROM reservations_v10 ORDER BY slot"
+    )
+    cursor.execute("DROP TABLE reservations_v10")
+    cursor.execute("CREATE UNIQUE INDEX reservations_by_slot ON reservations (slot, court_id)")
+    cursor.execute("CREATE UNIQUE INDEX reservations_by_user ON reservations (user_id) WHERE series_id IS NULL")
+    cursor.execute("CREATE INDEX reservations_by_series ON reservations (series_id, slot) WHERE series_id IS NOT NULL")
+
+# PRAGMA user_version records how many of these steps have been applied
+MIGRATIONS = [_schema_v1, _schema_v2, _schema_v3, _schema_v4, _schema_v5, _schema_v6, _schema_v7, _schema_v8, _schema_v9, _schema_v10, _schema_v11]
+
+# Dimensions of the utilization table and how a slot maps to each bucket
+UTILIZATION_DIMENSIONS = {
+    'hour': slot_hour,
+    'weekday': lambda slot: slot_date(slot).weekday(),
+    'month': lambda slot: slot_date(slot).year * 100 + slot_date(slot).month,
+}
+
+def _count_utilization(cursor, slot, court_id, column, amount=1):
+    # column is 'booked' or 'canceled'
+    _count_utilization_rows(cursor, [(slot, court_id)], column, amount)
+
+def _count_utilization_rows(cursor, rows, column, amount=1):
+    # Every (slot, court_id) of rows in one executemany
+    buckets = []
+    for slot, court_id in rows:
+        buckets += [(name, bucket(slot), amount) for name, bucket in UTILIZATION_DIMENSIONS.items()]
+        buckets.append(('court', court_id, amount))
+    cursor.executemany(
+        f"INSERT INTO utilization (dimension, bucket, {column}) VALUES (?, ?, ?) "
+        f"ON CONFLICT (dimension, bucket) DO UPDATE SET {column} = {column} + excluded.{column}",
+        buckets
+    )
+
+def create_reservations_table(connection):
+    if connection.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
+    cursor = connection.cursor()
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE so another process opening the file can't migrate twice
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if cursor.execute("PRAGMA user_version").fetchone()[0] < version:
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+@timed_query
+@retry_on_busy
+def save_reservation_to_db(user_id, slot, court_id=DEFAULT_COURT):
+    # Check-and-claim in one statement: returns False instead of raising when
+    # the slot is taken on that court or the user already holds a reservation
+    with db_connection() as connection:
+        cursor = connection.execute(
+            "INSERT INTO reservations (user_id, slot, court_id) VALUES (?, ?, ?) ON CONFLICT DO NOTHING RETURNING slot",
+            (user_id, slot, court_id)
+        )
+        claimed = cursor.fetchone() is not None
+        if claimed:
+            _count_utilization(connection, slot, court_id, 'booked')
+    if claimed:
+        availability_index.mark_reserved(slot, court_id)
+    return claimed
+
+@timed_query
+@retry_on_busy
+def delete_reservation_from_db(user_id):
+    # The user's ordinary reservation; series are cancelled with delete_series_from_db
+    with db_connection() as connection:
+        deleted = connection.execute(
+            "DELETE FROM reservations WHERE user_id=? AND series_id IS NULL RETURNING slot, court_id", (user_id,)
+        ).fetchall()
+        for slot, court_id in deleted:
+            _count_utilization(connection, slot, court_id, 'canceled')
+    for slot, court_id in deleted:
+        availability_index.mark_free(slot, court_id)
+
+@timed_query
+@retry_on_busy
+def save_series_to_db(user_id, bookings):
+    # All or nothing for a list of (slot, court_id): one indexed conflict
+    # query over the whole set, then one executemany, in a single write
+    # transaction. Returns (series_id, []) when every row went in, otherwise
+    # (None, conflicts) with the (slot, court_id, holder user_id) already taken.
+    wanted = ', '.join('(?, ?)' for _ in bookings)
+    with db_connection() as connection:
+        # Take the write lock before checking so nobody books in between
+        connection.execute("BEGIN IMMEDIATE")
+        conflicts = connection.execute(
+            f"WITH wanted (slot, court_id) AS (VALUES {wanted}) "
+            "SELECT r.slot, r.court_id, r.user_id FROM wanted "
+            "JOIN reservations AS r ON r.slot = wanted.slot AND r.court_id = wanted.court_id "
+            "ORDER BY r.slot",
+            [value for booking in bookings for value in booking]
+        ).fetchall()
+        if conflicts:
+            return None, conflicts
+        series_id = connection.execute(
+            "INSERT INTO reservation_series (user_id, created_at) VALUES (?, ?)", (user_id, int(time.time()))
+        ).lastrowid
+        connection.executemany(
+            "INSERT INTO reservations (user_id, slot, court_id, series_id) VALUES (?, ?, ?, ?)",
+            [(user_id, slot, court_id, series_id) for slot, court_id in bookings]
+        )
+        _count_utilization_rows(connection, bookings, 'booked')
+    for slot, court_id in bookings:
+        availability_index.mark_reserved(slot, court_id)
+    return series_id, []
+
+@timed_query
+@retry_on_busy
+def delete_series_from_db(user_id, series_id, from_slot):
+    # Cancels the occurrences of a user's series from from_slot on; returns
+    # their (slot, court_id). Earlier ones are left for the archive.
+    with db_connection() as connection:
+        deleted = connection.execute(
+            "DELETE FROM reservations WHERE series_id=? AND user_id=? AND slot >= ? RETURNING slot, court_id",
+            (series_id, user_id, from_slot)
+        ).fetchall()
+        _count_utilization_rows(connection, deleted, 'canceled')
+    for slot, court_id in deleted:
+        availability_index.mark_free(slot, court_id)
+    return deleted
+
+@timed_query
+def get_user_series(user_id, from_slot):
+    # (series_id, court_id, upcoming occurrences, first slot, last slot) per series
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT r.series_id, MIN(r.court_id), COUNT(*), MIN(r.slot), MAX(r.slot) "
+            "FROM reservation_series AS s JOIN reservations AS r ON r.series_id = s.series_id "
+            "WHERE s.user_id=? AND r.slot >= ? GROUP BY r.series_id ORDER BY MIN(r.slot)",
+            (user_id, from_slot)
+        ).fetchall()
+
+def _archive_rows(connection, rows):
+    connection.executemany(
+        "INSERT INTO reservations_archive (user_id, slot, court_id, archived_at) VALUES (?, ?, ?, ?)",
+        [(user_id, slot, court_id, int(time.time())) for user_id, slot, court_id in rows]
+    )
+    for _, slot, court_id in rows:
+        availability_index.mark_free(slot, court_id)
+
+@timed_query
+@retry_on_busy
+def archive_past_reservations(before_slot, limit):
+    # Moves up to `limit` reservations that start before before_slot in one
+    # short transaction; returns how many were moved
+    with db_connection() as connection:
+        rows = connection.execute(
+            "DELETE FROM reservations WHERE rowid IN (SELECT rowid FROM reservations WHERE slot < ? ORDER BY slot LIMIT ?) RETURNING user_id, slot, court_id",
+            (before_slot, limit)
+        ).fetchall()
+        _archive_rows(connection, rows)
+    return len(rows)
+
+@timed_query
+@retry_on_busy
+def archive_user_reservation(user_id):
+    with db_connection() as connection:
+        rows = connection.execute(
+            "DELETE FROM reservations WHERE user_id=? AND series_id IS NULL RETURNING user_id, slot, court_id", (user_id,)
+        ).fetchall()
+        _archive_rows(connection, rows)
+
+@timed_query
+def get_reserved_masks(first_day, days):
+    # The whole days x courts availability matrix in one grouped query: slots
+    # are unique per court, so summing 1 << hour builds each day's bitmask
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT slot / 24, court_id, SUM(1 << (slot % 24)) FROM reservations "
+            "WHERE slot >= ? AND slot < ? GROUP BY slot / 24, court_id",
+            day_range(first_day, days)
+        ).fetchall()
+
+@timed_query
+def get_slot_holder(slot, court_id=DEFAULT_COURT):
+    with db_connection() as connection:
+        row = connection.execute("SELECT user_id FROM reservations WHERE slot=? AND court_id=?", (slot, court_id)).fetchone()
+    return row[0] if row else None
+
+@timed_query
+def get_user_reservation(user_id):
+    # (slot, court_id) of the user's ordinary reservation, or None
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT slot, court_id FROM reservations WHERE user_id=? AND series_id IS NULL", (user_id,)
+        ).fetchone()
+
+# Export sources: table and the column that makes (slot, column) a unique,
+# indexed key for keyset pagination
+EXPORT_SOURCES = {
+    'live': ('reservations', 'court_id'),
+    'archive': ('reservations_archive', 'rowid'),
+}
+
+@timed_query
+def get_reservation_page(source, after, end, limit):
+    # Up to `limit` rows of (user_id, slot, court_id, first_name, last_name, key)
+    # ordered by the source's key, starting after the key tuple `after` and
+    # stopping before slot `end`. Each page is its own short read, so a long
+    # export never holds a pooled connection or a snapshot open.
+    table, tiebreak = EXPORT_SOURCES[source]
+    with db_connection() as connection:
+        return connection.execute(
+            f"SELECT r.user_id, r.slot, r.court_id, u.first_name, u.last_name, r.{tiebreak} "
+            f"FROM {table} AS r LEFT JOIN users AS u ON u.user_id = r.user_id "
+            f"WHERE (r.slot, r.{tiebreak}) > (?, ?) AND r.slot < ? "
+            f"ORDER BY r.slot, r.{tiebreak} LIMIT ?",
+            (*after, end, limit)
+        ).fetchall()
+
+def iter_reservations(source='live', start=0, end=2 ** 62, page_size=500):
+    # Streams (user_id, slot, court_id, first_name, last_name) with slot in [start, end)
+    after = (start, -1)
+    while True:
+        rows = get_reservation_page(source, after, end, page_size)
+        for row in rows:
+            yield row[:5]
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][1], rows[-1][5])
+
+@timed_query
+def get_pending_reminders(from_slot):
+    # (user_id, slot, court_id) of upcoming reservations not reminded yet
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT user_id, slot, court_id FROM reservations WHERE reminded=0 AND slot >= ? ORDER BY slot", (from_slot,)
+        ).fetchall()
+
+@timed_query
+@retry_on_busy
+def mark_reminded(reservations):
+    # One transaction for a whole batch of (user_id, slot, court_id)
+    with db_connection() as connection:
+        connection.executemany(
+            "UPDATE reservations SET reminded=1 WHERE user_id=? AND slot=? AND court_id=?", reservations
+        )
+
+@timed_query
+@retry_on_busy
+def join_waitlist(user_id, day, hour):
+    # False when the user is already waiting for that day/hour
+    with db_connection() as connection:
+        return connection.execute(
+            "INSERT INTO waitlist (day, hour, user_id, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING RETURNING entry_id",
+            (day, hour, user_id, int(time.time()))
+        ).fetchone() is not None
+
+@timed_query
+def get_waiters(day, hour, limit):
+    # First `limit` users waiting for that hour or for any hour of the day,
+    # as (entry_id, user_id) in FIFO order; two seeks on waitlist_by_hour
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT MIN(entry_id), user_id FROM waitlist "
+            "WHERE day=? AND hour IN (?, -1) AND offered_until IS NULL "
+            "GROUP BY user_id ORDER BY 1 LIMIT ?",
+            (day, hour, limit)
+        ).fetchall()
+
+@timed_query
+@retry_on_busy
+def mark_offered(offers):
+    # offers: (slot, court_id, offered_until, entry_id) rows, one transaction
+    with db_connection() as connection:
+        connection.executemany(
+            "UPDATE waitlist SET offered_slot=?, offered_court=?, offered_until=? WHERE entry_id=?", offers
+        )
+
+@timed_query
+def get_open_offers():
+    # (entry_id, user_id, slot, court_id, offered_until) of outstanding offers
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT entry_id, user_id, offered_slot, offered_court, offered_until FROM waitlist WHERE offered_until IS NOT NULL"
+        ).fetchall()
+
+@timed_query
+@retry_on_busy
+def remove_waitlist_entry(entry_id):
+    with db_connection() as connection:
+        connection.execute("DELETE FROM waitlist WHERE entry_id=?", (entry_id,))
+
+@timed_query
+@retry_on_busy
+def leave_waitlist(user_id, day):
+    # Drops every entry of the user for that day, e.g. once they booked it
+    with db_connection() as connection:
+        connection.execute("DELETE FROM waitlist WHERE user_id=? AND day=?", (user_id, day))
+
+@timed_query
+@retry_on_busy
+def purge_waitlist(before_day):
+    with db_connection() as connection:
+        return connection.execute("DELETE FROM waitlist WHERE day < ?", (before_day,)).rowcount
+
+@timed_query
+def get_utilization():
+    # {dimension: {bucket: (booked, canceled)}}
+    stats = {}
+    with db_connection() as connection:
+        for dimension, bucket, booked, canceled in connection.execute("SELECT dimension, bucket, booked, canceled FROM utilization"):
+            stats.setdefault(dimension, {})[bucket] = (booked, canceled)
+    return stats
+
+@timed_query
+def get_courts():
+    # {court_id: name} of the courts that can be booked
+    with db_connection() as connection:
+        return dict(connection.execute("SELECT court_id, name FROM courts WHERE active=1 ORDER BY court_id"))
+
+@timed_query
+@retry_on_busy
+def add_court(name):
+    with db_connection() as connection:
+        return connection.execute("INSERT INTO courts (name) VALUES (?) RETURNING court_id", (name,)).fetchone()[0]
+
+@timed_query
+@retry_on_busy
+def save_user_profile(profile):
+    with db_connection() as connection:
+        connection.execute(
+            "INSERT INTO users (user_id, first_name, last_name, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET first_name=excluded.first_name, last_name=excluded.last_name, updated_at=excluded.updated_at",
+            (profile['id'], profile['first_name'], profile['last_name'], int(time.time()))
+        )
+
+def _profile_from_row(row):
+    return {'id': row[0], 'first_name': row[1], 'last_name': row[2]}
+
+@timed_query
+def get_user_profile(user_id):
+    with db_connection() as connection:
+        row = connection.execute("SELECT user_id, first_name, last_name FROM users WHERE user_id=?", (user_id,)).fetchone()
+    return _profile_from_row(row) if row else None
+
+@timed_query
+def get_recent_user_profiles(limit):
+    with db_connection() as connection:
+        cursor = connection.execute("SELECT user_id, first_name, last_name FROM users ORDER BY updated_at DESC LIMIT ?", (limit,))
+        return [_profile_from_row(row) for row in cursor]
+
+@timed_query
+@retry_on_busy
+def save_conversation(user_id, day, masks, expires_at):
+    with db_connection() as connection:
+        connection.execute(
+            "INSERT INTO conversations (user_id, day, masks, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET day=excluded.day, masks=excluded.masks, expires_at=excluded.expires_at",
+            (user_id, day, masks, expires_at)
+        )
+
+@timed_query
+def get_conversation(user_id, now):
+    # (day, masks) unless missing or expired
+    with db_connection() as connection:
+        return connection.execute(
+            "SELECT day, masks FROM conversations WHERE user_id=? AND expires_at > ?", (user_id, now)
+        ).fetchone()
+
+@timed_query
+@retry_on_busy
+def delete_conversation(user_id):
+    with db_connection() as connection:
+        connection.execute("DELETE FROM conversations WHERE user_id=?", (user_id,))
+
+@timed_query
+@retry_on_busy
+def purge_conversations(now, max_rows):
+    # Drops expired conversations, then the oldest beyond max_rows
+    with db_connection() as connection:
+        expired = connection.execute("DELETE FROM conversations WHERE expires_at <= ?", (now,)).rowcount
+        evicted = connection.execute(
+            "DELETE FROM conversations WHERE user_id IN "
+            "(SELECT user_id FROM conversations ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (max_rows,)
+        ).rowcount
+    return expired + evicted
+
+@timed_query
+def count_conversations(now):
+    with db_connection() as connection:
+        return connection.execute("SELECT COUNT(*) FROM conversations WHERE expires_at > ?", (now,)).fetchone()[0]
+
+def _booking_window_masks(today=None):
+    return get_reserved_masks(today or date.today(), INDEX_DAYS)
+
+def load_availability_index(today=None):
+    availability_index.load(_booking_window_masks(today), list(get_courts()), today)
+
+def check_availability_index(today=None):
+    # Empty dict means the in-memory index matches the reservations table
+    return availability_index.diff(_booking_window_masks(today), today)
+
+def rebuild_availability_index(today=None):
+    mismatches = check_availability_index(today)
+    if mismatches:
+        print(f"Availability index out of sync on {len(mismatches)} day(s), rebuilding")
+        load_availability_index(today)
+    return mismatches
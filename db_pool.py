@@ -0,0 +1,109 @@
+import functools
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-connection settings. WAL lets readers run alongside the single writer;
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': int(os.getenv('SQLITE_CACHE_KB', '16384')) * -1,
+    'mmap_size': int(os.getenv('SQLITE_MMAP_BYTES', str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+}
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def retry_on_busy(function=None, attempts=5, base_delay=0.01):
+    # busy_timeout already waits for locks inside SQLite, but some conflicts
+    # (e.g. a read transaction that needs to upgrade) return SQLITE_BUSY at
+    # once; rerun the whole function with jittered backoff in that case
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return function(*args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if not is_busy_error(e) or attempt == attempts - 1:
+                        raise
+                    time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+        return wrapper
+    return decorate(function) if function is not None else decorate
+
+class ConnectionPool:
+    # Bounded pool of SQLite connections shared by all threads. Connections
+    # are checked out per operation, so a thread that exits holds none, and
+    # each keeps its own prepared-statement cache across checkouts.
+    def __init__(self, path, max_connections=None, busy_timeout=None, on_first_connect=None):
+        self.path = path
+        self.max_connections = max_connections or int(os.getenv('SQLITE_POOL_SIZE', '8'))
+        self.busy_timeout = busy_timeout or float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))
+        self.on_first_connect = on_first_connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._lock = threading.Lock()
+        self._all = []
+        self._initialised = False
+        self._closed = False
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        for name, value in PRAGMAS.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            if not self._initialised:
+                # journal_mode is persistent, so the first connection sets it for the file
+                connection.execute("PRAGMA journal_mode = WAL")
+                if self.on_first_connect is not None:
+                    self.on_first_connect(connection)
+                self._initialised = True
+            self._all.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        # Commits when the block succeeds, rolls back when it raises
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.busy_timeout):
+            raise sqlite3.OperationalError("database is busy: no free pooled connection")
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+                if connection.in_transaction:
+                    connection.commit()
+            except BaseException:
+                if connection.in_transaction:
+                    connection.rollback()
+                raise
+            finally:
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            connections, self._all = self._all, []
+        for connection in connections:
+            try:
+                connection.execute("PRAGMA optimize")
+                connection.close()
+            except sqlite3.Error as e:
+                print(f"Failed to close database connection: {e}")
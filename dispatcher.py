@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+import time
+
+def chat_key(update):
+    # Updates of one chat must land on the same shard; callbacks belong to the
+    # chat of the message their keyboard was attached to
+    message = update.message or update.edited_message
+    if message is not None:
+        return message.chat.id
+    callback = update.callback_query
+    if callback is not None:
+        return callback.message.chat.id if callback.message else callback.from_user.id
+    return update.update_id
+
+class Shard:
+    def __init__(self, index, max_queue):
+        self.index = index
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def stats(self):
+        return {
+            'shard': self.index,
+            'queue_depth': self.queue.qsize(),
+            'processed': self.processed,
+            'failed': self.failed,
+            'busy_seconds': self.busy_seconds,
+            'max_seconds': self.max_seconds,
+        }
+
+class ShardedDispatcher:
+    # Runs `process(update)` on N worker threads. Updates are hashed by chat
+    # id, so each chat is handled strictly in arrival order by one shard while
+    # different chats proceed in parallel. Updates `accept` turns down are
+    # dropped before they reach a queue.
+    def __init__(self, process, shards=None, max_queue=None, key=chat_key, accept=None):
+        self.process = process
+        self.key = key
+        self.accept = accept
+        count = shards or int(os.getenv('DISPATCH_SHARDS', '8'))
+        max_queue = max_queue or int(os.getenv('DISPATCH_QUEUE_SIZE', '1000'))
+        self.shards = [Shard(i, max_queue) for i in range(count)]
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for shard in self.shards:
+            thread = threading.Thread(target=self._run, args=(shard,), name=f'dispatch-shard-{shard.index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update, block=True, timeout=None):
+        # Returns False if the shard's queue is full (only when not blocking forever);
+        # a dropped update counts as handled
+        if self.accept is not None and not self.accept(update):
+            return True
+        shard = self.shards[hash(self.key(update)) % len(self.shards)]
+        try:
+            shard.queue.put(update, block=block, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self, shard):
+        while True:
+            update = shard.queue.get()
+            if update is None:
+                return
+            started = time.perf_counter()
+            try:
+                self.process(update)
+            except Exception as e:
+                shard.failed += 1
+                print(f"Failed to process update {getattr(update, 'update_id', None)} on shard {shard.index}: {e}")
+            elapsed = time.perf_counter() - started
+            shard.processed += 1
+            shard.busy_seconds += elapsed
+            if elapsed > shard.max_seconds:
+                shard.max_seconds = elapsed
+
+    def stats(self):
+        return [shard.stats() for shard in self.shards]
+
+    def stop(self):
+        for shard in self.shards:
+            shard.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,130 @@
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from render import render_reservation_card
+from metrics import RENDER_SECONDS
+
+JPEG_MAGIC = b'\xff\xd8'
+
+def _render_card(first_name, last_name, date, time_label, output_format, court=None):
+    # Runs in a worker process; BytesIO doesn't pickle, so return raw bytes
+    return render_reservation_card(first_name, last_name, date, time_label, output_format, court).getvalue()
+
+def _warm_up():
+    # Load Pillow and the font in the worker before the first real job
+    return len(_render_card('', '', '', '', None))
+
+def _report_warm_up(future):
+    if future.exception() is not None:
+        print(f"Failed to warm up card renderer: {future.exception()}")
+
+class ImagePipeline:
+    # Renders confirmation cards in a process pool so Pillow work never runs on
+    # the bot's update threads. Jobs wait in a bounded queue; when it is full,
+    # submit() blocks for up to `put_timeout` seconds and then gives up.
+    def __init__(self, workers=None, max_pending=None, put_timeout=2.0):
+        self.workers = workers or int(os.getenv('CARD_WORKERS', '2'))
+        self.max_pending = max_pending or int(os.getenv('CARD_QUEUE_SIZE', '32'))
+        self.put_timeout = put_timeout
+        self._jobs = queue.Queue(maxsize=self.max_pending)
+        self._executor = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.counters = {
+            'submitted': 0,
+            'rendered': 0,
+            'failed': 0,
+            'rejected': 0,
+            'in_flight': 0,
+            'render_seconds_total': 0.0,
+            'render_seconds_max': 0.0,
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._executor is not None:
+                return
+            # fork keeps the children from re-importing the bot module; start the
+            # pool early, before other threads exist. With fork every worker is
+            # created by the first submit, so the warm-up (Pillow and the font)
+            # can finish in the background instead of holding up startup.
+            executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            for _ in range(self.workers):
+                executor.submit(_warm_up).add_done_callback(_report_warm_up)
+            # One feeder thread per worker process keeps every worker busy
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._feed, name=f'image-pipeline-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._executor = executor
+
+    def submit(self, on_done, first_name, last_name, date, time_label, output_format=None, on_error=None, court=None):
+        self.start()
+        try:
+            self._jobs.put((on_done, on_error, (first_name, last_name, date, time_label, output_format, court)), timeout=self.put_timeout)
+        except queue.Full:
+            self._count('rejected')
+            return False
+        self._count('submitted')
+        return True
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _feed(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            on_done, on_error, args = job
+            self._count('in_flight')
+            started = time.perf_counter()
+            try:
+                data = self._executor.submit(_render_card, *args).result()
+            except Exception as e:
+                self._count('failed')
+                print(f"Failed to render reservation card: {e}")
+                if on_error is not None:
+                    on_error(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                RENDER_SECONDS.observe(elapsed)
+                with self._lock:
+                    self.counters['in_flight'] -= 1
+                    self.counters['render_seconds_total'] += elapsed
+                    self.counters['render_seconds_max'] = max(self.counters['render_seconds_max'], elapsed)
+            self._count('rendered')
+            photo = io.BytesIO(data)
+            photo.name = 'reservation.jpg' if data.startswith(JPEG_MAGIC) else 'reservation.png'
+            try:
+                on_done(photo)
+            except Exception as e:
+                print(f"Failed to deliver reservation card: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self._jobs.qsize()
+        stats['workers'] = self.workers
+        finished = stats['rendered'] + stats['failed']
+        stats['render_seconds_avg'] = stats['render_seconds_total'] / finished if finished else 0.0
+        return stats
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._executor.shutdown()
+        self._executor = None
+        self._threads = []
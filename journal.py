@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+from datetime import datetime as dt
+
+JOURNAL_PATH = os.getenv('JOURNAL_PATH', 'reservations.jsonl')
+
+class AuditJournal:
+    # Append-only JSONL audit log. Handlers only enqueue a record; a background
+    # thread batches records into the file, flushes/fsyncs according to the
+    # policy and rotates the file once it grows past max_bytes.
+    #   fsync='batch'  fsync after every written batch (default)
+    #   fsync='none'   leave it to the OS, only flush Python's buffer
+    def __init__(self, path=JOURNAL_PATH, batch_size=100, flush_interval=1.0, fsync=None, max_bytes=None, backups=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync or os.getenv('JOURNAL_FSYNC', 'batch')
+        self.max_bytes = max_bytes or int(os.getenv('JOURNAL_MAX_BYTES', str(50 * 1024 * 1024)))
+        self.backups = backups or int(os.getenv('JOURNAL_BACKUPS', '5'))
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-journal', daemon=True)
+                self._thread.start()
+
+    def record(self, event, **fields):
+        fields['event'] = event
+        fields['ts'] = dt.now().isoformat(timespec='seconds')
+        self._queue.put(fields)
+
+    def pending(self):
+        # Records queued but not yet written
+        return self._queue.qsize()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _next_batch(self):
+        # Block for the first record, then take whatever else is already queued
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        file = open(self.path, 'a', encoding='utf-8')
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = None in batch
+                records = [record for record in batch if record is not None]
+                if records:
+                    file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+                    file.flush()
+                    if self.fsync == 'batch':
+                        os.fsync(file.fileno())
+                    self.written += len(records)
+                    if file.tell() >= self.max_bytes:
+                        file.close()
+                        self._rotate()
+                        file = open(self.path, 'a', encoding='utf-8')
+                if stop:
+                    return
+        finally:
+            file.close()
+
+    def _rotate(self):
+        # reservations.jsonl -> .1 -> .2 ...; the oldest backup falls off the end
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+def journal_files(path=JOURNAL_PATH):
+    # Oldest first: highest-numbered backup down to the live file
+    backups = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        backups.append(f"{path}.{index}")
+        index += 1
+    files = list(reversed(backups))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+def iter_records(path=JOURNAL_PATH, user_id=None, since=None, until=None):
+    # Streams the journal line by line; since/until ("YYYY-MM-DD" or
+    # "YYYY-MM-DD HH:MM") bound the reservation time, until is exclusive
+    for file_path in journal_files(path):
+        with open(file_path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if user_id is not None and record.get('user_id') != user_id:
+                    continue
+                reservation = record.get('reservation', '')
+                if since is not None and reservation < since:
+                    continue
+                if until is not None and reservation >= until:
+                    continue
+                yield record
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the reservation audit journal")
+    parser.add_argument('--path', default=JOURNAL_PATH)
+    parser.add_argument('--user', type=int, help="only records for this Telegram user id")
+    parser.add_argument('--since', help="reservation time lower bound, YYYY-MM-DD[ HH:MM]")
+    parser.add_argument('--until', help="reservation time upper bound (exclusive), YYYY-MM-DD[ HH:MM]")
+    args = parser.parse_args(argv)
+    for record in iter_records(args.path, args.user, args.since, args.until):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+if __name__ == '__main__':
+    main()
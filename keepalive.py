@@ -1,16 +1,47 @@
-from flask import Flask,render_template
+from flask import Flask, Response, abort, request
 from threading import Thread
+import hmac
+from telebot import types
+from metrics import render_metrics
 
 app = Flask(__name__)
+# Telegram updates are a few KB at most; refuse anything bigger
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024
 
 #Function returns 'ALive' while running the program
 @app.route('/')
 def index():
     return "Alive"
 
+#Prometheus scrape endpoint
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 def run():
   app.run(host='0.0.0.0',port=8080)
 
-def keep_alive():  
+def keep_alive():
     t = Thread(target=run)
     t.start()
+    return t
+
+#Registers the webhook route; must be called before keep_alive()
+def enable_webhook(secret, dispatcher):
+    def receive_update():
+        # Telegram echoes the secret_token given to setWebhook in this header
+        if not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret):
+            abort(403)
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('update_id'), int):
+            abort(400)
+        try:
+            update = types.Update.de_json(payload)
+        except Exception:
+            abort(400)
+        if not dispatcher.submit(update, block=False):
+            # Shard queue is full; Telegram redelivers on non-2xx, so shed load instead of blocking
+            abort(503)
+        return ''
+
+    app.add_url_rule(f'/webhook/{secret}', 'webhook', receive_update, methods=['POST'])
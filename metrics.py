@@ -0,0 +1,186 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Latency buckets in seconds; DB calls get a finer low end
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Every metric, in registration order; rendered by /metrics
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+class Histogram:
+    # Fixed buckets; observe() is a bisect and three increments under a lock
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+class Gauge:
+    # Read when scraped: `read` returns a number, or {label values tuple: number}.
+    # kind='counter' exports a running total kept elsewhere.
+    def __init__(self, name, help, read, labelnames=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Failed to read gauge {self.name}: {e}")
+            return
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(number)}"
+
+def render_metrics():
+    # Prometheus text exposition format 0.0.4
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Time spent in each update handler', ['handler'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handlers that raised', ['handler'])
+DB_SECONDS = Histogram('bot_db_query_seconds', 'Time spent in each database helper, retries included', ['query'], DB_BUCKETS)
+DB_ERRORS = Counter('bot_db_query_errors_total', 'Database helpers that raised', ['query'])
+API_SECONDS = Histogram('bot_telegram_api_seconds', 'Telegram Bot API request latency', ['method'])
+API_ERRORS = Counter('bot_telegram_api_errors_total', 'Telegram Bot API requests that failed', ['method', 'status'])
+RENDER_SECONDS = Histogram('bot_card_render_seconds', 'Reservation card render time, queue excluded')
+
+def _timed(histogram, errors, name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            errors.inc(name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def timed_handler(function):
+    return _timed(HANDLER_SECONDS, HANDLER_ERRORS, function.__name__, function)
+
+def timed_async_handler(function):
+    # timed_handler for coroutines; the same handler name in both runtimes
+    name = function.__name__
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def timed_query(function):
+    return _timed(DB_SECONDS, DB_ERRORS, function.__name__, function)
+
+def instrument_telegram_api():
+    # Every Bot API request made through telebot's apihelper goes through
+    # CUSTOM_REQUEST_SENDER when it is set; time it per API method
+    from telebot import apihelper
+
+    def send(method, url, **kwargs):
+        name = urlsplit(url).path.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            response = apihelper._get_req_session().request(method, url, **kwargs)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+        if response.status_code != 200:
+            API_ERRORS.inc(name, str(response.status_code))
+        return response
+
+    apihelper.CUSTOM_REQUEST_SENDER = send
@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from telebot.apihelper import ApiTelegramException
+
+# Send priorities: replies to a user's own action go before notifications
+INTERACTIVE = 0
+BULK = 1
+
+# Telegram's limit for one text message
+MAX_MESSAGE_LENGTH = 4096
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        # Seconds until a token is available, 0 if one is available now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class _Job:
+    __slots__ = ('method', 'chat_id', 'args', 'kwargs', 'priority', 'seq', 'futures', 'attempts')
+
+    def __init__(self, method, chat_id, args, kwargs, priority, seq):
+        self.method = method
+        self.chat_id = chat_id
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.futures = [Future()]
+        self.attempts = 0
+
+class Outbox:
+    # Queue for every outgoing Bot API call. Sender threads drain it within a
+    # global token bucket and one bucket per chat, back off for `retry_after`
+    # when Telegram answers 429, serve INTERACTIVE before BULK, and merge
+    # consecutive plain texts to the same chat into a single sendMessage.
+    # Calls to one chat are always made in the order they were queued.
+    def __init__(self, bot, senders=None, global_rate=None, chat_rate=None, chat_burst=None, max_attempts=5):
+        self.bot = bot
+        self.senders = senders or int(os.getenv('OUTBOX_SENDERS', '4'))
+        self.global_rate = global_rate or float(os.getenv('OUTBOX_GLOBAL_RATE', '30'))
+        self.chat_rate = chat_rate or float(os.getenv('OUTBOX_CHAT_RATE', '1'))
+        self.chat_burst = chat_burst or int(os.getenv('OUTBOX_CHAT_BURST', '3'))
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._global_blocked_until = 0.0
+        self._chats = {}
+        self._buckets = {}
+        self._blocked_until = {}
+        self._busy = set()
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self.counters = {'queued': 0, 'sent': 0, 'merged': 0, 'retried': 0, 'failed': 0}
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def send_message(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        return self.submit('send_message', chat_id, (text,), kwargs, priority)
+
+    def send_photo(self, chat_id, photo, priority=INTERACTIVE, **kwargs):
+        return self.submit('send_photo', chat_id, (photo,), kwargs, priority)
+
+    def send_document(self, chat_id, document, priority=INTERACTIVE, **kwargs):
+        return self.submit('send_document', chat_id, (document,), kwargs, priority)
+
+    def send_location(self, chat_id, latitude, longitude, priority=INTERACTIVE, **kwargs):
+        return self.submit('send_location', chat_id, (latitude, longitude), kwargs, priority)
+
+    def submit(self, method, chat_id, args, kwargs, priority=INTERACTIVE):
+        # Returns a Future resolved with the API result
+        with self._cond:
+            self.counters['queued'] += 1
+            jobs = self._chats.get(chat_id)
+            if jobs and self._merge(jobs[-1], method, args, kwargs, priority):
+                self.counters['merged'] += 1
+                return jobs[-1].futures[-1]
+            self._seq += 1
+            job = _Job(method, chat_id, args, kwargs, priority, self._seq)
+            self._chats.setdefault(chat_id, deque()).append(job)
+            self._cond.notify()
+            return job.futures[0]
+
+    def _merge(self, tail, method, args, kwargs, priority):
+        # Only plain texts merge: the earlier one must carry no keyboard or
+        # other options, and the later one's options apply to the result
+        if method != 'send_message' or tail.method != 'send_message' or tail.attempts:
+            return False
+        if tail.kwargs or tail.priority != priority:
+            return False
+        text = f"{tail.args[0]}\n\n{args[0]}"
+        if len(text) > MAX_MESSAGE_LENGTH:
+            return False
+        tail.args = (text,)
+        tail.kwargs = kwargs
+        tail.futures.append(Future())
+        return True
+
+    def _next_job(self):
+        # Called with the condition held; returns a job or how long to wait
+        now = time.monotonic()
+        if self._global_blocked_until > now:
+            return None, self._global_blocked_until - now
+        best = None
+        wait = None
+        for chat_id, jobs in self._chats.items():
+            if not jobs or chat_id in self._busy:
+                continue
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = max(self._blocked_until.get(chat_id, 0) - now, bucket.delay(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+            elif best is None or (jobs[0].priority, jobs[0].seq) < (best.priority, best.seq):
+                best = jobs[0]
+        if best is None:
+            return None, wait
+        delay = self._global.delay(now)
+        if delay > 0:
+            return None, delay
+        self._global.take()
+        self._buckets[best.chat_id].take()
+        self._chats[best.chat_id].popleft()
+        self._busy.add(best.chat_id)
+        return best, None
+
+    def _release(self, chat_id):
+        # Called with the condition held after a job for chat_id finished
+        self._busy.discard(chat_id)
+        if not self._chats.get(chat_id):
+            self._chats.pop(chat_id, None)
+            self._blocked_until.pop(chat_id, None)
+            if len(self._buckets) > 10000:
+                # Forget buckets of idle chats; a new bucket starts full anyway
+                self._buckets = {chat: bucket for chat, bucket in self._buckets.items() if chat in self._chats}
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(wait)
+                    job, wait = self._next_job()
+            self._deliver(job)
+
+    def _deliver(self, job):
+        job.attempts += 1
+        for arg in job.args:
+            if hasattr(arg, 'seek'):
+                arg.seek(0)
+        try:
+            result = getattr(self.bot, job.method)(job.chat_id, *job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            retry_after = None
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+            self._finish(job, error=e, retry_after=retry_after)
+        except Exception as e:
+            # Network trouble: back off a little and try again
+            self._finish(job, error=e, retry_after=min(2 ** job.attempts, 30))
+        else:
+            self._finish(job, result=result)
+
+    def _finish(self, job, result=None, error=None, retry_after=None):
+        with self._cond:
+            if error is not None and retry_after is not None and job.attempts < self.max_attempts:
+                self.counters['retried'] += 1
+                until = time.monotonic() + retry_after
+                self._blocked_until[job.chat_id] = until
+                if isinstance(error, ApiTelegramException):
+                    # A 429 may be the global flood limit; slow every chat down briefly
+                    self._global_blocked_until = max(self._global_blocked_until, time.monotonic() + min(retry_after, 1))
+                self._chats.setdefault(job.chat_id, deque()).appendleft(job)
+                self._release(job.chat_id)
+                return
+            self.counters['failed' if error is not None else 'sent'] += 1
+            self._release(job.chat_id)
+        for future in job.futures:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        if error is not None:
+            print(f"Failed to {job.method} to chat {job.chat_id}: {error}")
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats['queue_depth'] = sum(len(jobs) for jobs in self._chats.values())
+            stats['chats_waiting'] = len(self._chats)
+        return stats
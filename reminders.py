@@ -0,0 +1,131 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+
+from db import mark_reminded
+
+Reminder = namedtuple('Reminder', 'user_id slot court_id')
+
+class ReminderScheduler:
+    # Sends a reminder `lead` seconds before each reservation starts. Pending
+    # reminders sit in a heap ordered by fire time; the thread sleeps until
+    # the earliest one is due, so it costs nothing while idle however many
+    # are pending. Cancelled reminders are dropped lazily when they surface.
+    # `send_batch` returns one future per reminder; a reminder is marked in
+    # the reservations table only once its future reports the message went
+    # out, so a restart resends whatever was queued or failed.
+    def __init__(self, send_batch, slot_timestamp, lead=None, batch_size=100):
+        self.send_batch = send_batch
+        self.slot_timestamp = slot_timestamp
+        self.lead = lead or float(os.getenv('REMINDER_LEAD', '3600'))
+        self.batch_size = batch_size
+        self._heap = []
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def load(self, reservations):
+        # Rows from get_pending_reminders at startup. Reminders that fell due
+        # while the bot was down still go out if the slot hasn't started.
+        for user_id, slot, court_id in reservations:
+            self._push(Reminder(user_id, slot, court_id), late_ok=True)
+
+    def add(self, user_id, slot, court_id):
+        # Booked less than `lead` before the slot: nothing to remind about
+        self._push(Reminder(user_id, slot, court_id), late_ok=False)
+
+    def _push(self, reminder, late_ok):
+        fire_at = self.slot_timestamp(reminder.slot) - self.lead
+        if not late_ok and fire_at <= time.time():
+            return
+        with self._cond:
+            if reminder in self._pending:
+                return
+            self._pending.add(reminder)
+            heapq.heappush(self._heap, (fire_at, reminder))
+            if self._heap[0][1] == reminder:
+                self._cond.notify()
+
+    def remove(self, user_id, slot, court_id):
+        with self._cond:
+            self._pending.discard(Reminder(user_id, slot, court_id))
+            # Lazy deletion leaves stale entries behind; compact if they pile up
+            if len(self._heap) > 2 * len(self._pending) + 64:
+                self._heap = [entry for entry in self._heap if entry[1] in self._pending]
+                heapq.heapify(self._heap)
+
+    def _next_batch(self):
+        # Blocks until something is due; returns None once stopped
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                _, reminder = heapq.heappop(self._heap)
+                if reminder in self._pending:
+                    self._pending.discard(reminder)
+                    batch.append(reminder)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            now = time.time()
+            due = [reminder for reminder in batch if self.slot_timestamp(reminder.slot) > now]
+            past = [reminder for reminder in batch if self.slot_timestamp(reminder.slot) <= now]
+            try:
+                # Slots that started meanwhile are never reminded about
+                if past:
+                    mark_reminded(past)
+                if due:
+                    for reminder, future in zip(due, self.send_batch(due)):
+                        future.add_done_callback(lambda future, reminder=reminder: self._sent(reminder, future))
+            except Exception as e:
+                print(f"Failed to send {len(batch)} reminder(s): {e}")
+            self.skipped += len(past)
+
+    def _sent(self, reminder, future):
+        # Runs on an outbox sender thread once the message is resolved
+        delivered = not future.cancelled() and future.exception() is None
+        with self._cond:
+            if delivered:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if not delivered:
+            return
+        try:
+            mark_reminded([reminder])
+        except Exception as e:
+            print(f"Failed to mark reminder for slot {reminder.slot}: {e}")
+
+    def pending(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='reminders', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,81 @@
+import io
+import os
+import threading
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arial.ttf")
+CARD_SIZE = (800, 400)
+FONT_SIZE = 20
+LINE_SPACING = 10
+
+# Encoder settings per output format. Cards are black text on white, so they
+# are rendered in grayscale, which keeps both PNG and JPEG output small.
+OUTPUT_FORMATS = {
+    'png': {'format': 'PNG', 'compress_level': int(os.getenv('CARD_PNG_COMPRESSION', '6'))},
+    'jpeg': {'format': 'JPEG', 'quality': int(os.getenv('CARD_JPEG_QUALITY', '80'))},
+}
+DEFAULT_FORMAT = os.getenv('CARD_FORMAT', 'png').lower()
+
+# Pillow is imported on first use, so processes that never render a card
+# (and the bot's own startup) don't pay for it
+_fonts = {}
+_templates = {}
+_cache_lock = threading.Lock()
+
+def get_font(size=FONT_SIZE):
+    # Fonts are loaded from disk once per process and shared afterwards
+    font = _fonts.get(size)
+    if font is None:
+        with _cache_lock:
+            font = _fonts.get(size)
+            if font is None:
+                from PIL import ImageFont
+                try:
+                    font = ImageFont.truetype(FONT_PATH, size=size)
+                except IOError:
+                    font = ImageFont.load_default()
+                _fonts[size] = font
+    return font
+
+def get_template(size=CARD_SIZE):
+    # Pre-rendered blank card; each render works on a copy of it
+    template = _templates.get(size)
+    if template is None:
+        with _cache_lock:
+            template = _templates.get(size)
+            if template is None:
+                from PIL import Image
+                template = Image.new('L', size, color=255)
+                _templates[size] = template
+    return template
+
+def render_reservation_card(first_name, last_name, date, time, output_format=None, court=None):
+    from PIL import ImageDraw
+    output_format = (output_format or DEFAULT_FORMAT).lower()
+    font = get_font()
+    image = get_template().copy()
+    draw = ImageDraw.Draw(image)
+    texts = [f"Name: {first_name} {last_name}", f"Date: {date}", f"Time: {time}"]
+    if court:
+        texts.append(f"Court: {court}")
+    # Measure every line exactly once and reuse it for centring and layout
+    sizes = []
+    for text in texts:
+        left, top, right, bottom = font.getbbox(text)
+        sizes.append((right - left, bottom - top))
+    total_text_height = sum(height + LINE_SPACING for _, height in sizes)
+    y_offset = (image.height - total_text_height) // 2
+    for text, (text_width, text_height) in zip(texts, sizes):
+        x_position = (image.width - text_width) // 2
+        draw.text((x_position, y_offset), text, font=font, fill=0)
+        y_offset += text_height + LINE_SPACING
+    return encode_image(image, output_format)
+
+def encode_image(image, output_format=None):
+    output_format = (output_format or DEFAULT_FORMAT).lower()
+    options = dict(OUTPUT_FORMATS[output_format])
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    buffer.seek(0)
+    # telebot uses the name for the multipart filename
+    buffer.name = f"reservation.{'jpg' if output_format == 'jpeg' else 'png'}"
+    return buffer
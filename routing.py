@@ -0,0 +1,48 @@
+class TextRouter:
+    # Dispatch table for incoming text messages. Commands are looked up by
+    # name; anything else goes to the slot handler when `slot_match(user_id,
+    # text)` says it is one of the time buttons that user was offered. Both
+    # are O(1), however many handlers, users or slots there are.
+    def __init__(self):
+        self.commands = {}
+        self.slot_handler = None
+        self.slot_match = None
+        self.fallback = None
+
+    def command(self, *names):
+        def register(handler):
+            for name in names:
+                self.commands[name] = handler
+            return handler
+        return register
+
+    def slot_selection(self, match):
+        # Decorator: @router.slot_selection(match) where match(user_id, text) -> bool
+        def register(handler):
+            self.slot_handler = handler
+            self.slot_match = match
+            return handler
+        return register
+
+    def default(self, handler):
+        self.fallback = handler
+        return handler
+
+    def route(self, message):
+        text = message.text
+        if not text:
+            return self.fallback
+        if text[0] == '/':
+            # Same parsing as telebot: "/cmd@botname args" -> "cmd"
+            name = text.split(maxsplit=1)[0].split('@', 1)[0][1:]
+            handler = self.commands.get(name)
+            if handler is not None:
+                return handler
+        elif self.slot_handler is not None and self.slot_match(message.from_user.id, text):
+            return self.slot_handler
+        return self.fallback
+
+    def dispatch(self, message):
+        handler = self.route(message)
+        if handler is not None:
+            handler(message)
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+from db import archive_past_reservations
+
+class ExpirySweeper:
+    # Background thread that moves past reservations into reservations_archive.
+    # Each batch is its own short transaction and the sweeper pauses between
+    # batches, so bookings never wait long behind it for the write lock.
+    def __init__(self, current_slot, interval=None, batch_size=None, pause=0.05):
+        self.current_slot = current_slot
+        self.interval = interval or float(os.getenv('SWEEP_INTERVAL', '300'))
+        self.batch_size = batch_size or int(os.getenv('SWEEP_BATCH_SIZE', '500'))
+        self.pause = pause
+        self.archived = 0
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        # A slot is past once the hour it starts in is over
+        before_slot = self.current_slot()
+        moved = 0
+        while not self._stop.is_set():
+            count = archive_past_reservations(before_slot, self.batch_size)
+            moved += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.archived += moved
+        self.last_run = time.time()
+        return moved
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                moved = self.sweep()
+                if moved:
+                    print(f"Archived {moved} past reservation(s)")
+            except Exception as e:
+                print(f"Reservation sweep failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,125 +1,333 @@
 from telebot import TeleBot, types
-from datetime import datetime as dt, timedelta, time
-import sqlite3
-import threading
+from datetime import datetime as dt, timedelta
+import functools
 import os
-from keepalive import keep_alive
-import pytz
-from PIL import Image, ImageDraw, ImageFont
-
-# Initialize bot with Telegram token
-bot = TeleBot(os.getenv('tg_key'))
-
-# Set the timezone to Nicosia, Cyprus (GMT+3)
-tz = pytz.timezone('Asia/Nicosia')
-
-# Call keep_alive function to connect to the Flask server
-keep_alive()
-
-# Create thread-local storage for SQLite connection
-local_storage = threading.local()
-
-# Stores all user's reservations
-available_time_slots = {}
-
-def get_db_connection():
-    if not hasattr(local_storage, 'db'):
-        db_dir = '/opt/render/project/src/data'
-        os.makedirs(db_dir, exist_ok=True)
-        db_path = os.path.join(db_dir, 'tennis_court_reservation.db')
-        local_storage.db = sqlite3.connect(db_path)
-        create_reservations_table()
-    return local_storage.db
-
-def create_reservations_table():
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reservations (
-            user_id INTEGER PRIMARY KEY,
-            reservation_time TEXT
-        )
-    ''')
-    db_connection.commit()
-
-def save_reservation_to_db(user_id, reservation_time):
-    cursor = get_db_connection().cursor()
-    cursor.execute("INSERT INTO reservations (user_id, reservation_time) VALUES (?, ?)", (user_id, reservation_time))
-    get_db_connection().commit()
-
-def delete_reservation_from_db(user_id):
-    cursor = get_db_connection().cursor()
-    cursor.execute("DELETE FROM reservations WHERE user_id=?", (user_id,))
-    get_db_connection().commit()
-
-def generate_reservation_image(first_name, last_name, date, time):
-    image = Image.new('RGB', (800, 400), color='white')
-    draw = ImageDraw.Draw(image)
-    font_path = os.path.join(os.path.dirname(__file__), "arial.ttf")
-    try:
-        font = ImageFont.truetype(font_path, size=20)
-    except IOError:
-        font = ImageFont.load_default()
-    texts = [f"Name: {first_name} {last_name}", f"Date: {date}", f"Time: {time}"]
-    total_text_height = 0
-    text_widths = []
-    for text in texts:
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        text_widths.append(text_width)
-        total_text_height += text_height + 10
-    y_offset = (image.height - total_text_height) // 2
-    for text, text_width in zip(texts, text_widths):
-        x_position = (image.width - text_width) // 2
-        draw.text((x_position, y_offset), text, font=font, fill='black')
-        y_offset += (draw.textbbox((0, 0), text, font=font)[3] - draw.textbbox((0, 0), text, font=font)[1]) + 10
-    image_path = f"{first_name}_{last_name}_{date}_{time.replace(':', '-')}.png"
-    image.save(image_path)
-    return image, image_path
+import re
+import sys
+import time
+from keepalive import keep_alive, enable_webhook
+from dispatcher import ShardedDispatcher
+from db import (
+    slot_key, slot_datetime, format_slot,
+    delete_reservation_from_db, archive_user_reservation,
+    get_user_reservation, get_courts, load_availability_index, lock_database,
+    save_user_profile, get_user_profile, get_recent_user_profiles,
+    get_pending_reminders, delete_series_from_db, get_user_series
+)
+from availability import availability_index, not_before_mask, BOOKING_CUTOFF_SECONDS, BOOKING_DAYS, OPEN_HOUR, CLOSE_HOUR
+from booking import book_slot, book_series, series_slots, slot_holds, Booked, SlotTaken, AlreadyBooked, SeriesBooked
+from routing import TextRouter
+from reminders import ReminderScheduler
+from waitlist import Waitlist, ANY_HOUR
+from image_pipeline import ImagePipeline
+from user_cache import UserCache, profile_from_user
+from journal import AuditJournal
+from sweeper import ExpirySweeper
+from outbox import Outbox, BULK
+from admission import Admission
+from admin import export_file, format_utilization, utilization_report
+from conversations import ANY_COURT, SlotChoices, create_conversation_store
+from metrics import Gauge, timed_handler, instrument_telegram_api
+import atexit
+
+# 'polling' (default) or 'webhook'; webhook mode needs WEBHOOK_URL and WEBHOOK_SECRET
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Longest text Telegram accepts in one message
+MESSAGE_LIMIT = 4096
+
+# Characters Telegram allows in setWebhook's secret_token
+WEBHOOK_SECRET_FORMAT = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+# 'sync' (default): TeleBot with dispatcher threads; 'async': an asyncio event
+# loop with coroutine handlers and one pooled aiohttp session (async_runtime.py)
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'sync')
+
+# Telegram user ids allowed to use /stats and /export, comma separated
+ADMIN_IDS = frozenset(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip())
+
+# /recurring limits for everyone but ADMIN_IDS: standing bookings with hours
+# still ahead per user, and hours (weeks x hours per week) in a new one
+RECURRING_MAX_SERIES = int(os.getenv('RECURRING_MAX_SERIES', '1'))
+RECURRING_MAX_HOURS = int(os.getenv('RECURRING_MAX_HOURS', '26'))
+
+# Timezone of the court (Nicosia, Cyprus); all slots are in its wall time
+COURT_TIMEZONE = 'Asia/Nicosia'
+
+# Importing this module only defines the handlers. create_app() builds and
+# starts everything below, run() then blocks serving updates.
+bot = None
+dispatcher = None
+# Drops floods and malformed updates before they reach the dispatcher
+admission = None
+# The AsyncRuntime when BOT_RUNTIME is 'async'
+runtime = None
+image_pipeline = None
+journal = None
+outbox = None
+server_thread = None
+sweeper = None
+user_cache = None
+reminders = None
+waitlist = None
+# Time keyboard each user is choosing from, as SlotChoices
+conversations = None
+
+# Bookable courts, {court_id: name}
+courts = {}
+
+# Seconds spent in each create_app() phase, in order
+startup_timings = {}
+
+# Routes text messages to the command and time-slot handlers below
+router = TextRouter()
+
+@functools.lru_cache(maxsize=None)
+def court_tz():
+    # pytz and its zone data load on first use
+    import pytz
+    return pytz.timezone(COURT_TIMEZONE)
+
+def slot_timestamp(slot):
+    # Epoch seconds at which a slot starts
+    return court_tz().localize(slot_datetime(slot)).timestamp()
+
+def current_slot():
+    now = dt.now(court_tz())
+    return slot_key(now.date(), now.hour)
+
+def create_app():
+    # Builds the bot and starts its background workers. Returns the startup
+    # timings, {phase: seconds}; calling it again is a no-op.
+    global bot, dispatcher, admission, runtime, image_pipeline, journal, outbox, server_thread, sweeper, user_cache, conversations, reminders, waitlist, courts
+    if bot is not None:
+        return startup_timings
+    check_webhook_config()
+    # Bookings, holds, reminders and offers are tracked in this process only
+    lock_database()
+    started = last = time.perf_counter()
+
+    def phase(name):
+        nonlocal last
+        now = time.perf_counter()
+        startup_timings[name] = now - last
+        last = now
+
+    admission = Admission(CALLBACK_DATA)
+    if BOT_RUNTIME == 'async':
+        # aiohttp and the async handlers load only in this mode
+        from async_runtime import AsyncRuntime
+        import async_handlers
+        # This module, not a fresh import of telegrambot: started as
+        # `python telegrambot.py` it runs as __main__, and a second copy
+        # would never have its globals filled in by create_app()
+        async_handlers.app = sys.modules[__name__]
+        runtime = AsyncRuntime(os.getenv('tg_key'), async_handlers.process_update, accept=admission.admit)
+        # Blocking facade for the outbox and sync handlers; requests still
+        # run on the event loop
+        bot = runtime.bot
+        dispatcher = runtime.dispatcher
+    else:
+        # Handlers run on the dispatcher's shard threads, so telebot doesn't need
+        # its own thread pool on top
+        bot = TeleBot(os.getenv('tg_key'), threaded=False)
+        instrument_telegram_api()
+        bot.register_callback_query_handler(route_callback, func=lambda call: True)
+        bot.register_message_handler(route_text, content_types=['text'])
+        # Per-chat ordered dispatch: one chat's updates run in order on one shard,
+        # different chats run in parallel. Shards only start in run().
+        dispatcher = ShardedDispatcher(lambda update: bot.process_new_updates([update]), accept=admission.admit)
+    phase('bot')
+
+    # Card rendering workers are forked before any other thread is running
+    image_pipeline = ImagePipeline()
+    image_pipeline.start()
+    phase('image_pipeline')
+
+    # Up early so health checks pass while the rest loads; webhook updates
+    # wait in the shard queues until run() starts the dispatcher
+    if BOT_MODE == 'webhook':
+        enable_webhook(os.getenv('WEBHOOK_SECRET'), dispatcher)
+    server_thread = keep_alive()
+    phase('web_server')
+
+    # Audit log of bookings and cancellations, written by a background thread
+    journal = AuditJournal()
+    journal.start()
+    atexit.register(journal.close)
+    # Every outgoing message goes through this queue, which keeps within
+    # Telegram's global and per-chat rate limits and retries on 429
+    outbox = Outbox(bot)
+    outbox.start()
+    phase('workers')
+
+    # Load the slot availability index once; handlers keep it in sync afterwards
+    load_availability_index()
+    courts = get_courts()
+    phase('database')
+
+    # Moves finished reservations to the archive table in the background
+    sweeper = ExpirySweeper(current_slot)
+    sweeper.start()
+    # Profiles seen in earlier runs, most recent last so they sit at the LRU's fresh end
+    user_cache = UserCache()
+    for profile in reversed(get_recent_user_profiles(user_cache.max_size)):
+        user_cache.put(profile)
+    conversations = create_conversation_store()
+    phase('caches')
+
+    # Reminders for every upcoming reservation not reminded yet
+    reminders = ReminderScheduler(send_reminders, slot_timestamp)
+    reminders.load(get_pending_reminders(current_slot()))
+    reminders.start()
+    phase('reminders')
+
+    # Freed slots are offered to waiting users; outstanding offers survive restarts
+    waitlist = Waitlist(send_waitlist_offers, slot_timestamp)
+    waitlist.load(current_slot() // 24)
+    waitlist.start()
+    phase('waitlist')
+
+    register_gauges()
+    startup_timings['total'] = time.perf_counter() - started
+    print("Startup: " + ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in startup_timings.items()))
+    return startup_timings
+
+def register_gauges():
+    # Sizes and queue depths, read when /metrics is scraped
+    Gauge('bot_startup_seconds', 'Time spent in each startup phase', lambda: {(name,): seconds for name, seconds in startup_timings.items()}, ['phase'])
+    Gauge('bot_pending_slot_selections', 'Users holding a time keyboard', lambda: len(conversations))
+    Gauge('bot_conversations_evicted_total', 'Conversations dropped by TTL or size limit', lambda: conversations.evicted, kind='counter')
+    Gauge('bot_user_cache_profiles', 'Profiles in the user cache', lambda: len(user_cache))
+    Gauge('bot_user_cache_lookups_total', 'User cache lookups by result', lambda: {('hit',): user_cache.hits, ('miss',): user_cache.misses}, ['result'], kind='counter')
+    Gauge('bot_outbox_calls_total', 'Outbox calls by outcome', lambda: {(name,): value for name, value in outbox.counters.items()}, ['outcome'], kind='counter')
+    Gauge('bot_updates_admitted_total', 'Updates passed on to the handlers', lambda: admission.admitted, kind='counter')
+    Gauge('bot_updates_dropped_total', 'Updates dropped before any handler ran', lambda: {(reason,): count for reason, count in admission.dropped.items()}, ['reason'], kind='counter')
+    if runtime is None:
+        Gauge('bot_dispatch_queue_depth', 'Updates waiting per dispatcher shard', lambda: {(shard.index,): shard.queue.qsize() for shard in dispatcher.shards}, ['shard'])
+    else:
+        Gauge('bot_updates_in_flight', 'Updates admitted and not handled yet', lambda: dispatcher.in_flight)
+    Gauge('bot_outbox_queue_depth', 'Outgoing API calls waiting to be sent', lambda: outbox.stats()['queue_depth'])
+    Gauge('bot_card_queue_depth', 'Reservation cards waiting for a render worker', lambda: image_pipeline.stats()['queue_depth'])
+    Gauge('bot_card_in_flight', 'Reservation cards being rendered', lambda: image_pipeline.stats()['in_flight'])
+    Gauge('bot_reminders_pending', 'Reminders scheduled but not sent yet', reminders.pending)
+    Gauge('bot_reminders_sent_total', 'Reminders delivered by the Bot API', lambda: reminders.sent, kind='counter')
+    Gauge('bot_reminders_failed_total', 'Reminders the Bot API refused; resent after a restart', lambda: reminders.failed, kind='counter')
+    Gauge('bot_waitlist_offers_pending', 'Waitlist offers waiting to be claimed', waitlist.pending)
+    Gauge('bot_waitlist_offers_total', 'Waitlist offers by outcome', lambda: {('offered',): waitlist.offered, ('claimed',): waitlist.claimed, ('expired',): waitlist.expired}, ['outcome'], kind='counter')
+    Gauge('bot_journal_queue_depth', 'Audit records waiting to be written', journal.pending)
+
+def court_name(court_id):
+    return courts.get(court_id, f"Court {court_id}")
+
+def not_before_now():
+    # Slots starting within the next 5 minutes can't be booked any more
+    return (dt.now(court_tz()) + timedelta(seconds=BOOKING_CUTOFF_SECONDS)).replace(tzinfo=None)
+
+# Last date keyboard built, reused until a booking/cancel or the clock changes it
+date_keyboard_cache = {}
 
 def generate_date_selection_buttons():
+    # Returns None when every day of the week is fully booked
     current_time = dt.now()
+    not_before = not_before_now()
+    key = (availability_index.version, slot_holds.version, current_time.date(), not_before_mask(not_before.date(), not_before))
+    cached = date_keyboard_cache.get('markup')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    # The whole week comes from the in-memory days x courts matrix
+    matrix = availability_index.matrix(current_time.date(), 7, not_before)
     markup = types.InlineKeyboardMarkup()
+    shown = 0
     for i in range(7):
         date = current_time + timedelta(days=i)
-        button = types.InlineKeyboardButton(text=date.strftime('%b %d'), callback_data=date.strftime('%Y-%m-%d'))
-        markup.add(button)
+        free = matrix[date.toordinal()]
+        # Hours held for a waitlist offer aren't bookable from here either
+        for court_id, held in slot_holds.held_masks(date.toordinal()).items():
+            if court_id in free:
+                free[court_id] &= ~held
+        count = sum(mask.bit_count() for mask in free.values())
+        # Full days are left out, so nobody taps into a dead end
+        if not count:
+            continue
+        text = f"{date.strftime('%b %d')} · {count} free"
+        if len(courts) > 1:
+            text += f" ({', '.join(court_name(court_id) for court_id, mask in free.items() if mask)})"
+        markup.add(types.InlineKeyboardButton(text=text, callback_data=date.strftime('%Y-%m-%d')))
+        shown += 1
+    markup = markup if shown else None
+    date_keyboard_cache['markup'] = (key, markup)
     return markup
 
-def generate_available_time_slots(date):
-    start_of_day = time(0, 0)
-    aware_date_start = tz.localize(dt.combine(date, start_of_day))
-    reserved_slots = get_reserved_time_slots(date)
-    available_slots = [
-        aware_date_start + timedelta(hours=h)
-        for h in range(6, 22)
-        if (aware_date_start + timedelta(hours=h)).strftime('%H:%M') not in reserved_slots
-    ]
-    return available_slots
-
-def get_reserved_time_slots(date):
-    cursor = get_db_connection().cursor()
-    cursor.execute("SELECT reservation_time FROM reservations WHERE strftime('%Y-%m-%d', reservation_time) = ?", (date.strftime('%Y-%m-%d'),))
-    reserved_times = cursor.fetchall()
-    reserved_slots = [dt.strptime(time[0], '%Y-%m-%d %H:%M').strftime('%H:%M') for time in reserved_times]
-    return reserved_slots
-
-def send_confirmation(chat_id, reservation_datetime, message, user_info):
-    user_id = message.from_user.id
-    first_name = user_info['first_name']
+def generate_time_choices(date, user_id=None):
+    # SlotChoices served from the in-memory index. With a single court the
+    # choice is just the hour (ANY_COURT) and book_slot picks the court.
+    # Slots held for someone else's waitlist offer are left out.
+    free = availability_index.free_masks(date, not_before_now())
+    for court_id, held in slot_holds.held_masks(date.toordinal(), user_id).items():
+        if court_id in free:
+            free[court_id] &= ~held
+    if len(courts) <= 1:
+        mask = 0
+        for court_mask in free.values():
+            mask |= court_mask
+        return SlotChoices(date.toordinal(), ((ANY_COURT, mask),) if mask else ())
+    return SlotChoices(date.toordinal(), tuple((court_id, mask) for court_id, mask in free.items() if mask))
+
+def choice_labels(choices):
+    # {button label: (hour, court_id or None)} in hour order
+    labels = {}
+    for hour in range(OPEN_HOUR, CLOSE_HOUR):
+        for court_id, mask in choices.masks:
+            if mask >> hour & 1:
+                if court_id == ANY_COURT:
+                    labels[slot_label(hour)] = (hour, None)
+                else:
+                    labels[f"{slot_label(hour)} {court_name(court_id)}"] = (hour, court_id)
+    return labels
+
+def parse_choice(choices, text):
+    # Inverse of choice_labels for one label: (hour, court_id or None), or
+    # None when the text isn't a button of `choices`
+    if len(text) < 5 or text[2:5] != ':00' or not text[:2].isdigit():
+        return None
+    hour = int(text[:2])
+    name = text[5:].strip()
+    court_id = ANY_COURT
+    if name:
+        court_id = next((court for court, court_label in courts.items() if court_label == name), None)
+    for choice_court, mask in choices.masks:
+        if choice_court == court_id and mask >> hour & 1:
+            return hour, (None if court_id == ANY_COURT else court_id)
+    return None
+
+def is_slot_choice(user_id, text):
+    # Cheap format check first, so ordinary text never touches the store
+    if len(text) < 5 or text[2:5] != ':00':
+        return False
+    choices = conversations.get(user_id)
+    return choices is not None and parse_choice(choices, text) is not None
+
+def remember_choices(user_id, choices):
+    if choices.masks:
+        conversations.put(user_id, choices)
+    else:
+        conversations.discard(user_id)
+
+def send_confirmation(chat_id, user_id, reservation_datetime, user_info, court_id):
+    first_name = user_info.get('first_name', '')
     last_name = user_info.get('last_name', '')
-    image, image_path = generate_reservation_image(
-        first_name, last_name,
-        reservation_datetime.strftime('%Y-%m-%d'),
-        reservation_datetime.strftime('%H:%M')
+    date_label = reservation_datetime.strftime('%Y-%m-%d')
+    time_label = reservation_datetime.strftime('%H:%M')
+    # Acknowledge right away; the card photo follows once a worker has rendered it
+    court = court_name(court_id) if len(courts) > 1 else None
+    where = f" on {court}" if court else ""
+    outbox.send_message(chat_id, f"Congratulations! You have successfully reserved the tennis court for {date_label} at {time_label}{where}!")
+    image_pipeline.submit(
+        lambda photo: outbox.send_photo(chat_id, photo, caption="Your reservation card"),
+        first_name, last_name, date_label, time_label, court=court
     )
-    with open(image_path, 'rb') as photo:
-        bot.send_photo(chat_id, photo, caption="Congratulations! You have successfully reserved the tennis court!")
-    os.remove(image_path)
-    save_reservation_to_db(user_id, reservation_datetime.strftime('%Y-%m-%d %H:%M'))
-    new_reservation = (user_id, reservation_datetime)
-    save_reservation_to_file(new_reservation, 'reservations.txt')
+    record_reservation('booked', user_id, f"{date_label} {time_label}", court_id)
     start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     start_markup.add(
         types.KeyboardButton('/start'),
@@ -128,40 +336,97 @@ def send_confirmation(chat_id, reservation_datetime, message, user_info):
         types.KeyboardButton('/support'),
         types.KeyboardButton('/location')
     )
-    bot.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
+    outbox.send_message(chat_id, "Choose the function:", reply_markup=start_markup)
+
+def send_reminders(batch):
+    # Called by the scheduler with every reminder that fell due together;
+    # they queue behind interactive replies in the outbox. Returns the
+    # outbox futures, one per reminder, in batch order.
+    futures = []
+    for reminder in batch:
+        where = f" on {court_name(reminder.court_id)}" if len(courts) > 1 else ""
+        futures.append(outbox.send_message(
+            reminder.user_id,
+            f"Reminder: you have the tennis court{where} at {format_slot(reminder.slot)}. Use /cancel if you can't make it.",
+            priority=BULK
+        ))
+    return futures
+
+def send_waitlist_offers(offers):
+    # One batch per freed slot; offers are time-limited, so they don't wait
+    # behind bulk traffic
+    minutes = int(waitlist.claim_window // 60)
+    for offer in offers:
+        where = f" on {court_name(offer.court_id)}" if len(courts) > 1 else ""
+        markup = types.InlineKeyboardMarkup()
+        markup.add(types.InlineKeyboardButton(text="Book it", callback_data=f"claim:{offer.slot}:{offer.court_id}"))
+        outbox.send_message(
+            offer.user_id,
+            f"Good news: the tennis court{where} at {format_slot(offer.slot)} just became free. It's held for you for {minutes} minutes.",
+            reply_markup=markup
+        )
+
+def full_hours(choices):
+    # (free, full) hour masks of the choices' day: hours with a court left,
+    # and hours still ahead that are booked out
+    free = 0
+    for _, mask in choices.masks:
+        free |= mask
+    day = dt.fromordinal(choices.day).date()
+    return free, not_before_mask(day, not_before_now()) & ~free
 
-def save_reservation_to_file(reservation, file_path):
-    user_id, reservation_time = reservation
-    if isinstance(reservation_time, dt):
-        reservation_time_formatted = reservation_time.strftime("%Y-%m-%d %H:%M")
+def waitlist_markup(choices):
+    # Inline buttons to join the waitlist for the day, or for each hour of
+    # it that is still ahead but fully booked; None when nothing is full
+    free, full = full_hours(choices)
+    if not full:
+        return None
+    markup = types.InlineKeyboardMarkup(row_width=4)
+    if not free:
+        markup.add(types.InlineKeyboardButton(text="Join the waitlist", callback_data=f"wait:{choices.day}:{ANY_HOUR}"))
     else:
-        reservation_time_formatted = reservation_time
+        markup.add(*[
+            types.InlineKeyboardButton(text=slot_label(hour), callback_data=f"wait:{choices.day}:{hour}")
+            for hour in range(OPEN_HOUR, CLOSE_HOUR) if full >> hour & 1
+        ])
+    return markup
+
+def record_reservation(event, user_id, reservation_time, court_id):
+    # Only enqueues; the journal's writer thread does the file I/O
     user_info = get_user_info(user_id)
-    first_name = user_info['first_name']
-    last_name = user_info.get('last_name', '')
-    reservation_info = f"User ID: {user_id}, Name: {first_name} {last_name}, Reservation Date and Time: {reservation_time_formatted}\n"
-    with open(file_path, 'a') as file:
-        file.write(reservation_info)
+    journal.record(
+        event,
+        user_id=user_id,
+        first_name=user_info.get('first_name', ''),
+        last_name=user_info.get('last_name', ''),
+        reservation=reservation_time,
+        court_id=court_id,
+        court=court_name(court_id)
+    )
 
-def get_all_reservations():
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor()
-    cursor.execute("SELECT user_id, reservation_time FROM reservations")
-    return cursor.fetchall()
+def remember_user(user):
+    # Every update carries the sender's profile; only changed profiles hit the db
+    profile = profile_from_user(user)
+    if user_cache.put(profile):
+        save_user_profile(profile)
 
 def get_user_info(user_id):
-    try:
-        user = bot.get_chat(user_id)
-        return {
-            'id': user.id,
-            'first_name': user.first_name,
-            'last_name': user.last_name
-        }
-    except Exception as e:
-        print(f"Failed to get user information for user_id {user_id}: {e}")
-        return {}
-
-@bot.message_handler(commands=['start'])
+    profile = user_cache.get(user_id)
+    if profile is not None:
+        return profile
+    profile = get_user_profile(user_id)
+    if profile is None:
+        try:
+            profile = profile_from_user(bot.get_chat(user_id))
+        except Exception as e:
+            print(f"Failed to get user information for user_id {user_id}: {e}")
+            return {}
+        save_user_profile(profile)
+    user_cache.put(profile)
+    return profile
+
+@router.command('start')
+@timed_handler
 def send_welcome(message):
     start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     start_markup.add(
@@ -171,15 +436,16 @@ def send_welcome(message):
         types.KeyboardButton('/support'),
         types.KeyboardButton('/location')
     )
-    bot.send_message(message.chat.id, "Welcome to the Tennis Court Reservation Bot!\n\nUse /start to start again.\n\nUse /reserve to book a court for 1 hour.\n\nUse /cancel to cancel your reservation.\n\nUse /support to text the support team.\n\nUse /location to get the court location.")
-    bot.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
+    outbox.send_message(message.chat.id, "Welcome to the Tennis Court Reservation Bot!\n\nUse /start to start again.\n\nUse /reserve to book a court for 1 hour.\n\nUse /cancel to cancel your reservation.\n\nUse /recurring to book the same time every week.\n\nUse /support to text the support team.\n\nUse /location to get the court location.")
+    outbox.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
 
-@bot.message_handler(commands=['support'])
+@router.command('support')
+@timed_handler
 def on_start_command(message):
     markup = types.InlineKeyboardMarkup()
     btn = types.InlineKeyboardButton("Text support", url='https://t.me/ImMrAlex')
     markup.add(btn)
-    bot.send_message(message.chat.id, "Press the button to text the support team.", reply_markup=markup)
+    outbox.send_message(message.chat.id, "Press the button to text the support team.", reply_markup=markup)
     start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     start_markup.add(
         types.KeyboardButton('/start'),
@@ -188,14 +454,15 @@ def on_start_command(message):
         types.KeyboardButton('/support'),
         types.KeyboardButton('/location')
     )
-    bot.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
+    outbox.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
 
-@bot.message_handler(commands=['location'])
+@router.command('location')
+@timed_handler
 def send_location(message):
     latitude = 34.70197266790477
     longitude = 33.07582804045963
-    bot.send_location(message.chat.id, latitude, longitude)
-    bot.send_message(message.chat.id, 'Court is near Sklavenitis Columbia Parking, behind Sklavenitis Columbia, Germasogeia Limassol')
+    outbox.send_location(message.chat.id, latitude, longitude)
+    outbox.send_message(message.chat.id, 'Court is near Sklavenitis Columbia Parking, behind Sklavenitis Columbia, Germasogeia Limassol')
     start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     start_markup.add(
         types.KeyboardButton('/start'),
@@ -204,90 +471,322 @@ def send_location(message):
         types.KeyboardButton('/support'),
         types.KeyboardButton('/location')
     )
-    bot.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
+    outbox.send_message(message.chat.id, "Choose the function:", reply_markup=start_markup)
 
-@bot.message_handler(commands=['reserve'])
+@router.command('reserve')
+@timed_handler
 def ask_for_date(message):
     chat_id = message.chat.id
     user_id = message.from_user.id
-    cursor = get_db_connection().cursor()
-    cursor.execute("SELECT reservation_time FROM reservations WHERE user_id=?", (user_id,))
-    reservation_time = cursor.fetchone()
-    if reservation_time:
-        reservation_time_naive = dt.strptime(reservation_time[0], '%Y-%m-%d %H:%M')
-        reservation_time_aware = tz.localize(reservation_time_naive)
-        if reservation_time_aware > dt.now(tz):
-            bot.send_message(chat_id, f"You already have a reservation on {reservation_time[0]}. You can't make a new reservation until this one is past.")
+    reservation = get_user_reservation(user_id)
+    if reservation is not None:
+        reservation_slot, _ = reservation
+        reservation_time_aware = court_tz().localize(slot_datetime(reservation_slot))
+        if reservation_time_aware > dt.now(court_tz()):
+            send_already_booked(chat_id, reservation_slot)
             return
         else:
-            delete_reservation_from_db(user_id)
+            archive_user_reservation(user_id)
+    send_date_keyboard(chat_id)
+
+def send_already_booked(chat_id, slot):
+    outbox.send_message(chat_id, f"You already have a reservation on {format_slot(slot)}. You can't make a new reservation until this one is past.")
+
+def send_date_keyboard(chat_id):
     markup = generate_date_selection_buttons()
-    bot.send_message(chat_id, "Please select the date you want to play:", reply_markup=markup)
+    if markup is None:
+        outbox.send_message(chat_id, "Sorry, every slot is booked for the next 7 days. Please try again later.")
+        return
+    outbox.send_message(chat_id, "Please select the date you want to play:", reply_markup=markup)
 
-@bot.message_handler(commands=['cancel'])
+@router.command('cancel')
+@timed_handler
 def cancel(message):
     chat_id = message.chat.id
     user_id = message.from_user.id
-    cursor = get_db_connection().cursor()
-    cursor.execute("SELECT reservation_time FROM reservations WHERE user_id=?", (user_id,))
-    reservation_time = cursor.fetchone()
-    if reservation_time:
-        reservation_date = dt.strptime(reservation_time[0], '%Y-%m-%d %H:%M').date()
-        delete_reservation_from_db(user_id)
-        generate_available_time_slots(reservation_date)
-        bot.send_message(chat_id, "Your reservation has been canceled.")
-        new_reservation = (user_id, f"{reservation_time[0]}, canceled")
-        save_reservation_to_file(new_reservation, 'reservations.txt')
+    reservation = get_user_reservation(user_id)
+    if reservation is not None:
+        cancel_reservation(user_id, *reservation)
+        outbox.send_message(chat_id, "Your reservation has been canceled.")
+    else:
+        outbox.send_message(chat_id, "You don't have any reservation to cancel.")
+
+def cancel_reservation(user_id, slot, court_id):
+    delete_reservation_from_db(user_id)
+    reminders.remove(user_id, slot, court_id)
+    record_reservation('canceled', user_id, format_slot(slot), court_id)
+    waitlist.slot_freed(slot, court_id)
+
+@router.command('stats')
+@timed_handler
+def send_stats(message):
+    if message.from_user.id not in ADMIN_IDS:
+        handle_text(message)
+        return
+    outbox.send_message(message.chat.id, format_utilization(utilization_report()))
+
+@router.command('export')
+@timed_handler
+def send_export(message):
+    # /export [all|live|archive] [since YYYY-MM-DD] [until YYYY-MM-DD]
+    if message.from_user.id not in ADMIN_IDS:
+        handle_text(message)
+        return
+    args = message.text.split()[1:]
+    source = args[0] if args and args[0] in ('all', 'live', 'archive') else 'all'
+    dates = [arg for arg in args if arg not in ('all', 'live', 'archive')]
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    try:
+        file, count = export_file(source, since, until)
+    except ValueError:
+        outbox.send_message(message.chat.id, "Usage: /export [all|live|archive] [since YYYY-MM-DD] [until YYYY-MM-DD]")
+        return
+    outbox.send_document(
+        message.chat.id, file, visible_file_name=f"reservations-{source}.csv", caption=f"{count} reservation(s)"
+    ).add_done_callback(lambda _: file.close())
+
+RECURRING_USAGE = (
+    "Usage:\n"
+    "/recurring - list your standing bookings\n"
+    "/recurring YYYY-MM-DD HH:MM WEEKS [HOURS] [COURT] - book that weekday and time for WEEKS weeks\n"
+    "/recurring cancel ID - cancel the remaining occurrences of a standing booking"
+)
+
+@router.command('recurring')
+@timed_handler
+def recurring(message):
+    # Standing bookings, e.g. "/recurring 2026-10-20 19:00 10 2" for Tuesdays
+    # 19:00-21:00 over 10 weeks. Open to every user within the RECURRING_MAX_*
+    # limits; admins have none.
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    args = message.text.split()[1:]
+    if not args:
+        series = get_user_series(user_id, current_slot())
+        lines = [
+            f"#{series_id}: {count} upcoming, {format_slot(first)} to {format_slot(last)}"
+            + (f" on {court_name(court_id)}" if len(courts) > 1 else "")
+            for series_id, court_id, count, first, last in series
+        ]
+        outbox.send_message(chat_id, "\n".join(lines) if lines else "You have no standing bookings.")
+        return
+    if args[0] == 'cancel' and len(args) == 2 and args[1].isdigit():
+        cancel_series(chat_id, user_id, int(args[1]))
+        return
+    try:
+        first_slot = slot_key(dt.strptime(args[0], '%Y-%m-%d').date(), dt.strptime(args[1], '%H:%M').hour)
+        weeks = int(args[2])
+        hours = int(args[3]) if len(args) > 3 else 1
+        court_id = int(args[4]) if len(args) > 4 else None
+    except (IndexError, ValueError):
+        outbox.send_message(chat_id, RECURRING_USAGE)
+        return
+    try:
+        slots = series_slots(first_slot, weeks, hours, today=dt.fromordinal(current_slot() // 24).date())
+    except ValueError as e:
+        outbox.send_message(chat_id, f"Nothing was booked: {e}.")
+        return
+    if court_id is not None and court_id not in courts:
+        outbox.send_message(chat_id, f"Unknown court {court_id}.")
+        return
+    if user_id not in ADMIN_IDS:
+        if len(slots) > RECURRING_MAX_HOURS:
+            outbox.send_message(chat_id, f"Nothing was booked: a standing booking can have at most {RECURRING_MAX_HOURS} hours (weeks x hours).")
+            return
+        if len(get_user_series(user_id, current_slot())) >= RECURRING_MAX_SERIES:
+            outbox.send_message(chat_id, f"Nothing was booked: you can have {RECURRING_MAX_SERIES} standing booking(s) at a time. Use /recurring to see yours.")
+            return
+    result = book_series(user_id, slots, court_id, not_before=not_before_now())
+    where = f" on {court_name(result.court_id)}" if len(courts) > 1 else ""
+    if isinstance(result, SeriesBooked):
+        for slot in slots:
+            reminders.add(user_id, slot, result.court_id)
+            record_reservation('booked', user_id, format_slot(slot), result.court_id)
+        outbox.send_message(chat_id, f"Standing booking #{result.series_id}: {len(slots)} hour(s){where} from {format_slot(slots[0])} to {format_slot(slots[-1])}.")
+        return
+    # Nothing was booked; list the occurrences that stood in the way
+    header = f"Nothing was booked: {len(result.conflicts)} of {len(slots)} hour(s){where} can't be booked."
+    outbox.send_message(chat_id, join_lines(header, [f"{format_slot(slot)} {reason}" for slot, reason in result.conflicts]))
+
+def join_lines(header, lines, limit=MESSAGE_LIMIT):
+    # header and as many lines as fit in one message, then how many were left out
+    text = header
+    for shown, line in enumerate(lines):
+        more = f"\n... and {len(lines) - shown} more"
+        if len(text) + 1 + len(line) + len(more) > limit:
+            return text + more
+        text += "\n" + line
+    return text
+
+def cancel_series(chat_id, user_id, series_id):
+    canceled = delete_series_from_db(user_id, series_id, current_slot() + 1)
+    if not canceled:
+        outbox.send_message(chat_id, f"No upcoming occurrences of standing booking #{series_id}.")
+        return
+    for slot, court_id in canceled:
+        reminders.remove(user_id, slot, court_id)
+        record_reservation('canceled', user_id, format_slot(slot), court_id)
+        waitlist.slot_freed(slot, court_id)
+    outbox.send_message(chat_id, f"Standing booking #{series_id} canceled: {len(canceled)} hour(s) freed.")
+
+# Every callback_data the keyboards above produce: a date, a waitlist join
+# (date ordinal, opening hour or ANY_HOUR) and a waitlist claim (slot, court
+# id). Anything else is dropped by admission before a handler runs; the
+# handlers still check the values against today and the booking window.
+CALLBACK_DATA = re.compile(
+    r'\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])'
+    rf'|wait:\d{{6}}:({ANY_HOUR}|{"|".join(str(hour) for hour in range(OPEN_HOUR, CLOSE_HOUR))})'
+    r'|claim:\d{8}:\d{1,9}'
+)
+
+def route_callback(call):
+    # Inline buttons: "wait:..." and "claim:..." from the waitlist, a bare
+    # date from the date keyboard
+    kind = call.data.split(':', 1)[0]
+    if kind == 'wait':
+        process_waitlist_join(call)
+    elif kind == 'claim':
+        process_claim(call)
+    else:
+        process_date_selection(call)
+
+@timed_handler
+def process_waitlist_join(call):
+    # callback data wait:<date ordinal>:<hour or ANY_HOUR>
+    chat_id = call.message.chat.id
+    user_id = call.from_user.id
+    _, day, hour = call.data.split(':')
+    day, hour = int(day), int(hour)
+    today = current_slot() // 24
+    if day < today:
+        outbox.send_message(chat_id, "Sorry, that day is over.")
+        return
+    if day > today + BOOKING_DAYS or hour != ANY_HOUR and not OPEN_HOUR <= hour < CLOSE_HOUR:
+        # Not a button waitlist_markup makes
+        outbox.send_message(chat_id, "Sorry, you can only join the waitlist for opening hours within the next 7 days.")
+        return
+    # Only what waitlist_markup would offer right now: a booked-out hour
+    # still ahead, or a day with no free hour left
+    free, full = full_hours(generate_time_choices(dt.fromordinal(day).date(), user_id))
+    label = dt.fromordinal(day).strftime('%Y-%m-%d')
+    if hour != ANY_HOUR:
+        label += f" at {slot_label(hour)}"
+    wanted = free | full if hour == ANY_HOUR else 1 << hour
+    if free & wanted:
+        outbox.send_message(chat_id, f"{label} isn't fully booked. Use /reserve to book it.")
+    elif not full & wanted:
+        outbox.send_message(chat_id, "Sorry, that time is over.")
+    elif waitlist.join(user_id, day, hour):
+        outbox.send_message(chat_id, f"You're on the waitlist for {label}. We'll message you if a court frees up.")
+    else:
+        outbox.send_message(chat_id, f"You're already on the waitlist for {label}.")
+
+@timed_handler
+def process_claim(call):
+    # callback data claim:<slot>:<court id>, from a waitlist offer
+    remember_user(call.from_user)
+    chat_id = call.message.chat.id
+    user_id = call.from_user.id
+    _, slot, court_id = call.data.split(':')
+    slot, court_id = int(slot), int(court_id)
+    if slot_holds.holder(slot, court_id) != user_id:
+        outbox.send_message(chat_id, "Sorry, this offer has expired.")
+        return
+    if slot_datetime(slot) < not_before_now():
+        # Too close to the start, as for everyone booking through /reserve
+        waitlist.decline(user_id, slot, court_id)
+        outbox.send_message(chat_id, "Sorry, this offer has expired.")
+        return
+    result = book_slot(user_id, slot, court_id)
+    if isinstance(result, Booked):
+        waitlist.claim(user_id, slot, court_id)
+        reminders.add(user_id, slot, court_id)
+        reservation_datetime = court_tz().localize(slot_datetime(slot))
+        send_confirmation(chat_id, user_id, reservation_datetime, get_user_info(user_id), court_id)
+    elif isinstance(result, AlreadyBooked):
+        waitlist.decline(user_id, slot, court_id)
+        outbox.send_message(chat_id, f"You already have a reservation on {format_slot(result.slot)}, so the slot went to the next person waiting.")
     else:
-        bot.send_message(chat_id, "You don't have any reservation to cancel.")
+        outbox.send_message(chat_id, "Sorry, this slot is no longer available.")
 
-@bot.callback_query_handler(func=lambda call: True)
+@timed_handler
 def process_date_selection(call):
+    remember_user(call.from_user)
     chat_id = call.message.chat.id
     user_id = call.from_user.id
     selected_date = call.data
-    reservation_date = dt.strptime(selected_date, '%Y-%m-%d').date()
+    try:
+        reservation_date = dt.strptime(selected_date, '%Y-%m-%d').date()
+    except ValueError:
+        # Matches CALLBACK_DATA but isn't a real date, e.g. 2026-02-31
+        reservation_date = None
     current_time = dt.now().date()
     next_7_days = current_time + timedelta(days=7)
-    if current_time <= reservation_date <= next_7_days:
-        available_slots = generate_available_time_slots(reservation_date)
-        if not available_slots:
-            bot.send_message(chat_id, f"Sorry, no available time slots for {reservation_date.strftime('%Y-%m-%d')}.")
+    if reservation_date is not None and current_time <= reservation_date <= next_7_days:
+        choices = generate_time_choices(reservation_date, user_id)
+        remember_choices(user_id, choices)
+        if not choices.masks:
+            outbox.send_message(chat_id, f"Sorry, no available time slots for {reservation_date.strftime('%Y-%m-%d')}.", reply_markup=waitlist_markup(choices))
         else:
-            available_time_slots[user_id] = {'date': reservation_date, 'slots': available_slots}
-            markup = generate_time_selection_buttons(available_slots)
-            bot.send_message(chat_id, f"Available time slots for {reservation_date.strftime('%Y-%m-%d')}:", reply_markup=markup)
+            markup = generate_time_selection_buttons(choices)
+            outbox.send_message(chat_id, f"Available time slots for {reservation_date.strftime('%Y-%m-%d')}:", reply_markup=markup)
+            full = waitlist_markup(choices)
+            if full is not None:
+                outbox.send_message(chat_id, "Fully booked hours; tap one to join its waitlist:", reply_markup=full)
     else:
-        bot.send_message(chat_id, "Sorry, you can only reserve a time within the next 7 days.")
+        outbox.send_message(chat_id, "Sorry, you can only reserve a time within the next 7 days.")
+
+def slot_label(hour):
+    return f"{hour:02d}:00"
 
-def generate_time_selection_buttons(available_slots):
+def generate_time_selection_buttons(choices):
+    # One row per hour; with several courts the row holds that hour's free courts
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
-    current_datetime = dt.now(tz)
-    for slot in available_slots:
-        if 6 <= slot.hour < 22 and slot >= current_datetime + timedelta(minutes=5):
-            button = types.KeyboardButton(slot.strftime('%H:%M'))
-            markup.add(button)
+    rows = {}
+    for label, (hour, _) in choice_labels(choices).items():
+        rows.setdefault(hour, []).append(types.KeyboardButton(label))
+    for buttons in rows.values():
+        markup.add(*buttons)
     return markup
 
-@bot.message_handler(func=lambda message: message.text and message.text in [slot.strftime('%H:%M') for slot in available_time_slots.get(message.from_user.id, {}).get('slots', [])])
+@router.slot_selection(is_slot_choice)
+@timed_handler
 def process_time_selection(message):
     chat_id = message.chat.id
     user_id = message.from_user.id
-    selected_time = message.text.strip()
-    selected_date = available_time_slots[user_id]['date']
-    selected_time_obj = dt.strptime(selected_time, '%H:%M').time()
-    reservation_datetime = dt.combine(selected_date, selected_time_obj)
-    reservation_datetime = tz.localize(reservation_datetime)
-    if reservation_datetime < dt.now(tz):
-        bot.send_message(chat_id, "You cannot reserve a time in the past.")
-    else:
-        save_reservation_to_db(user_id, reservation_datetime.strftime('%Y-%m-%d %H:%M'))
+    choices = conversations.get(user_id)
+    choice = parse_choice(choices, message.text) if choices is not None else None
+    if choice is None:
+        # Expired or evicted since routing
+        handle_text(message)
+        return
+    selected_date = dt.fromordinal(choices.day).date()
+    hour, court_id = choice
+    selected_time = slot_label(hour)
+    reservation_datetime = court_tz().localize(slot_datetime(slot_key(selected_date, hour)))
+    if reservation_datetime < dt.now(court_tz()):
+        outbox.send_message(chat_id, "You cannot reserve a time in the past.")
+        return
+    result = book_slot(user_id, slot_key(selected_date, hour), court_id)
+    if isinstance(result, AlreadyBooked):
+        send_already_booked(chat_id, result.slot)
+        return
+    if isinstance(result, Booked):
+        reminders.add(user_id, result.slot, result.court_id)
         user_info = get_user_info(user_id)
-        send_confirmation(chat_id, reservation_datetime, message, user_info)
-        available_time_slots[user_id]['slots'] = [slot for slot in available_time_slots[user_id]['slots'] if slot.strftime('%H:%M') != selected_time]
-        available_time_slots[user_id]['slots'] = [slot for slot in available_time_slots[user_id]['slots'] if slot.astimezone(tz) > dt.now(tz)]
+        send_confirmation(chat_id, user_id, reservation_datetime, user_info, result.court_id)
+    choices = generate_time_choices(selected_date, user_id)
+    remember_choices(user_id, choices)
+    if isinstance(result, SlotTaken):
+        if choices.masks:
+            markup = generate_time_selection_buttons(choices)
+            outbox.send_message(chat_id, f"Sorry, {selected_time} was just booked by someone else. Still available on {selected_date.strftime('%Y-%m-%d')}:", reply_markup=markup)
+        else:
+            outbox.send_message(chat_id, f"Sorry, {selected_time} was just booked by someone else and no other slots are left on {selected_date.strftime('%Y-%m-%d')}.", reply_markup=waitlist_markup(choices))
 
-@bot.message_handler(content_types=['text'])
+@router.default
+@timed_handler
 def handle_text(message):
     start_markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     start_markup.add(
@@ -297,6 +796,60 @@ def handle_text(message):
         types.KeyboardButton('/support'),
         types.KeyboardButton('/location')
     )
-    bot.send_message(message.chat.id, "Choose command to continue:", reply_markup=start_markup)
+    outbox.send_message(message.chat.id, "Choose command to continue:", reply_markup=start_markup)
+
+def poll_updates(timeout=20):
+    # Long-polls getUpdates and hands every update to the dispatcher; a full
+    # shard queue blocks here, which throttles polling instead of dropping
+    offset = None
+    while True:
+        try:
+            updates = bot.get_updates(offset=offset, timeout=timeout, long_polling_timeout=timeout)
+        except Exception as e:
+            print(f"Failed to get updates: {e}")
+            time.sleep(3)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            dispatcher.submit(update)
+
+# Single entry point for text messages; the router picks the handler in O(1)
+@timed_handler
+def route_text(message):
+    remember_user(message.from_user)
+    router.dispatch(message)
+
+def check_webhook_config():
+    # Before anything starts: without both variables the webhook route and
+    # setWebhook call would fail only once requests arrive
+    if BOT_MODE != 'webhook':
+        return
+    if not os.getenv('WEBHOOK_URL'):
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_URL, the bot's public https:// address")
+    if not WEBHOOK_SECRET_FORMAT.fullmatch(os.getenv('WEBHOOK_SECRET') or ''):
+        raise ValueError("BOT_MODE=webhook needs WEBHOOK_SECRET: 1-256 characters from A-Z, a-z, 0-9, _ and -")
+
+def webhook_url():
+    return f"{os.getenv('WEBHOOK_URL').rstrip('/')}/webhook/{os.getenv('WEBHOOK_SECRET')}"
+
+def run():
+    # Serves updates until the process is stopped
+    if runtime is not None:
+        runtime.run(BOT_MODE, webhook_url() if BOT_MODE == 'webhook' else None, os.getenv('WEBHOOK_SECRET'))
+        return
+    dispatcher.start()
+    if BOT_MODE == 'webhook':
+        bot.remove_webhook()
+        bot.set_webhook(url=webhook_url(), secret_token=os.getenv('WEBHOOK_SECRET'))
+        server_thread.join()
+    else:
+        # Polling fails while a webhook is registered, e.g. after switching modes
+        bot.remove_webhook()
+        poll_updates()
+
+def main():
+    create_app()
+    run()
 
-bot.polling(none_stop=True)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules live in the repository root; db.py reads DB_DIR on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DB_DIR', tempfile.mkdtemp(prefix='tennis-tests-'))
+
+import db
+from availability import availability_index
+from booking import slot_holds
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A fresh database file per test; the pool, the availability index and
+    # the slot holds are process-wide, so they are reset around each test
+    monkeypatch.setattr(db, 'DB_DIR', str(tmp_path))
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'tennis_court_reservation.db'))
+    monkeypatch.setattr(db, '_pool', None)
+    slot_holds._holds.clear()
+    yield db
+    if db._pool is not None:
+        db._pool.close()
+    availability_index.load([])
+    slot_holds._holds.clear()
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+from admission import Admission
+from telegrambot import CALLBACK_DATA
+
+def text_update(user_id, text='/reserve'):
+    message = SimpleNamespace(text=text, from_user=SimpleNamespace(id=user_id))
+    return SimpleNamespace(message=message, callback_query=None)
+
+def callback_update(user_id, data, message_id=1):
+    callback = SimpleNamespace(
+        data=data,
+        from_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(message_id=message_id),
+        inline_message_id=None
+    )
+    return SimpleNamespace(message=None, callback_query=callback)
+
+def make_admission(**kwargs):
+    options = {'rate': 1000, 'burst': 1000, 'dedup_window': 60}
+    options.update(kwargs)
+    return Admission(CALLBACK_DATA, **options)
+
+def test_unsupported_and_invalid_updates_are_dropped():
+    admission = make_admission()
+    sticker = SimpleNamespace(message=SimpleNamespace(text=None, from_user=SimpleNamespace(id=1)), callback_query=None)
+    assert not admission.admit(sticker)
+    assert not admission.admit(callback_update(1, 'rm -rf'))
+    assert not admission.admit(callback_update(1, ''))
+    assert admission.admit(text_update(1))
+    assert admission.stats() == {'unsupported': 1, 'invalid_callback': 2, 'admitted': 1}
+
+def test_repeated_callback_is_dropped():
+    admission = make_admission()
+    assert admission.admit(callback_update(1, '2026-10-20'))
+    assert not admission.admit(callback_update(1, '2026-10-20'))
+    # Another user, keyboard or button is not a repeat
+    assert admission.admit(callback_update(2, '2026-10-20'))
+    assert admission.admit(callback_update(1, '2026-10-20', message_id=2))
+    assert admission.admit(callback_update(1, '2026-10-21'))
+    assert admission.stats()['duplicate_callback'] == 1
+
+def test_flooding_user_is_rate_limited():
+    admission = make_admission(rate=0.001, burst=3)
+    assert [admission.admit(text_update(1)) for _ in range(5)] == [True, True, True, False, False]
+    # Other users have their own bucket
+    assert admission.admit(text_update(2))
+    assert admission.stats()['rate_limited'] == 2
+
+@pytest.mark.parametrize('data, valid', [
+    ('2026-10-20', True),
+    ('2026-02-31', True),
+    ('2026-99-99', False),
+    ('wait:739909:18', True),
+    ('wait:739909:-1', True),
+    ('wait:739909:5', False),
+    ('wait:739909:22', False),
+    ('wait:3000000:10', False),
+    ('claim:17757834:1', True),
+    ('claim:1:1', False),
+])
+def test_callback_data_format(data, valid):
+    assert bool(CALLBACK_DATA.fullmatch(data)) == valid
@@ -0,0 +1,47 @@
+from datetime import date, datetime, timedelta
+
+from availability import availability_index, AvailabilityIndex, OPEN_HOURS_MASK, not_before_mask
+from db import slot_key
+
+TOMORROW = date.today() + timedelta(days=1)
+
+def test_index_tracks_reservations():
+    index = AvailabilityIndex()
+    index.load([], courts=[1, 2])
+    slot = slot_key(TOMORROW, 10)
+    index.mark_reserved(slot, 1)
+    assert index.free_masks(TOMORROW) == {1: OPEN_HOURS_MASK & ~(1 << 10), 2: OPEN_HOURS_MASK}
+    assert index.free_courts(TOMORROW, 10) == [2]
+    version = index.version
+    index.mark_free(slot, 1)
+    assert index.free_courts(TOMORROW, 10) == [1, 2]
+    assert index.version > version
+
+def test_not_before_hides_hours_that_started():
+    day = date(2026, 10, 20)
+    assert not_before_mask(day, None) == OPEN_HOURS_MASK
+    assert not_before_mask(day, datetime(2026, 10, 19, 23, 0)) == OPEN_HOURS_MASK
+    assert not_before_mask(day, datetime(2026, 10, 21, 0, 0)) == 0
+    # 10:05: the 10:00 slot has started, 11:00 is the first one left
+    assert not_before_mask(day, datetime(2026, 10, 20, 10, 5)) == OPEN_HOURS_MASK & ~((1 << 11) - 1)
+
+def test_index_follows_bookings_and_cancellations(database):
+    database.load_availability_index()
+    slot = slot_key(TOMORROW, 10)
+    assert database.save_reservation_to_db(1, slot)
+    assert availability_index.free_courts(TOMORROW, 10) == []
+    database.delete_reservation_from_db(1)
+    assert availability_index.free_courts(TOMORROW, 10) == [1]
+    assert database.check_availability_index() == {}
+
+def test_check_finds_and_rebuild_repairs_drift(database):
+    database.load_availability_index()
+    slot = slot_key(TOMORROW, 10)
+    # A write the index never heard about, e.g. from a manual fix in the table
+    with database.db_connection() as connection:
+        connection.execute("INSERT INTO reservations (user_id, slot, court_id) VALUES (?, ?, ?)", (1, slot, 1))
+    key = (TOMORROW.toordinal(), 1)
+    assert database.check_availability_index() == {key: (0, 1 << 10)}
+    assert database.rebuild_availability_index() == {key: (0, 1 << 10)}
+    assert database.check_availability_index() == {}
+    assert availability_index.free_courts(TOMORROW, 10) == []
@@ -0,0 +1,52 @@
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from booking import book_slot, slot_holds, Booked, SlotTaken, AlreadyBooked
+from db import slot_key
+
+TOMORROW = date.today() + timedelta(days=1)
+
+@pytest.fixture
+def index(database):
+    database.load_availability_index()
+    return database
+
+def count_reservations(database):
+    with database.db_connection() as connection:
+        return connection.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+
+def test_book_slot_outcomes(index):
+    slot = slot_key(TOMORROW, 10)
+    assert book_slot(1, slot) == Booked(slot, 1)
+    assert book_slot(2, slot) == SlotTaken(slot, None)
+    assert book_slot(2, slot, 1) == SlotTaken(slot, 1)
+    # One ordinary booking per user
+    assert book_slot(1, slot + 1) == AlreadyBooked(slot, 1)
+    assert count_reservations(index) == 1
+
+def test_book_slot_respects_holds(index):
+    slot = slot_key(TOMORROW, 10)
+    slot_holds.hold(slot, 1, 9, time.time() + 60)
+    assert book_slot(2, slot) == SlotTaken(slot, None)
+    assert book_slot(9, slot) == Booked(slot, 1)
+
+def test_racing_users_get_one_booking(index):
+    slot = slot_key(TOMORROW, 10)
+    start = threading.Barrier(16)
+    results = []
+
+    def book(user_id):
+        start.wait()
+        results.append(book_slot(user_id, slot, 1))
+
+    threads = [threading.Thread(target=book, args=(user_id,)) for user_id in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(isinstance(result, Booked) for result in results) == 1
+    assert sum(isinstance(result, SlotTaken) for result in results) == 15
+    assert count_reservations(index) == 1
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from conversations import (
+    ANY_COURT, MemoryConversationStore, SQLiteConversationStore, SlotChoices,
+    create_conversation_store, decode_masks, encode_masks
+)
+
+def choices(hour):
+    return SlotChoices(739909, ((ANY_COURT, 1 << hour),))
+
+def test_masks_round_trip():
+    masks = ((1, 1 << 10 | 1 << 11), (2, 1 << 21))
+    assert decode_masks(encode_masks(masks)) == masks
+    assert decode_masks(encode_masks(())) == ()
+
+def test_memory_store_evicts_least_recent_beyond_max_size():
+    store = MemoryConversationStore(ttl=60, max_size=2)
+    store.put(1, choices(10))
+    store.put(2, choices(11))
+    # Renewing user 1 makes user 2 the least recent
+    store.put(1, choices(12))
+    store.put(3, choices(13))
+    assert store.get(1) == choices(12)
+    assert store.get(2) is None
+    assert store.get(3) == choices(13)
+    assert store.evicted == 1
+
+def test_memory_store_expires_idle_entries():
+    store = MemoryConversationStore(ttl=0.05, max_size=10)
+    store.put(1, choices(10))
+    time.sleep(0.1)
+    assert store.get(1) is None
+    assert store.evicted == 1
+    store.put(2, choices(11))
+    store.discard(2)
+    assert store.get(2) is None and len(store) == 0
+
+def test_sqlite_store_expires_and_caps_entries(database):
+    store = SQLiteConversationStore(ttl=60, max_size=2, purge_interval=0)
+    store.put(1, choices(10))
+    store.put(2, choices(11))
+    store.put(3, choices(12))
+    # The purge keeps the max_size entries that expire last
+    assert store.get(1) is None
+    assert store.get(3) == choices(12)
+    assert len(store) == 2
+    store.discard(3)
+    assert store.get(3) is None
+
+    short = SQLiteConversationStore(ttl=0.05, max_size=10, purge_interval=0)
+    short.put(4, choices(13))
+    time.sleep(0.1)
+    assert short.get(4) is None
+
+def test_store_backend_is_chosen_by_name():
+    assert isinstance(create_conversation_store('memory'), MemoryConversationStore)
+    assert isinstance(create_conversation_store('sqlite'), SQLiteConversationStore)
+    with pytest.raises(ValueError):
+        create_conversation_store('redis')
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+import telegrambot as app
+from availability import availability_index, DEFAULT_COURT, OPEN_HOUR, CLOSE_HOUR
+from booking import slot_holds
+from db import slot_key
+
+@pytest.fixture
+def keyboard(database, monkeypatch):
+    database.load_availability_index()
+    monkeypatch.setattr(app, 'courts', {DEFAULT_COURT: 'Court 1'})
+    app.date_keyboard_cache.clear()
+    yield
+    app.date_keyboard_cache.clear()
+
+def day_button(day):
+    markup = app.generate_date_selection_buttons()
+    buttons = [button for row in markup.keyboard for button in row] if markup else []
+    return next((button.text for button in buttons if button.callback_data == day.strftime('%Y-%m-%d')), None)
+
+def book_all_but(day, hour):
+    for other in range(OPEN_HOUR, CLOSE_HOUR):
+        if other != hour:
+            availability_index.mark_reserved(slot_key(day, other))
+
+def test_days_show_their_free_hours(keyboard):
+    day = app.dt.now().date() + timedelta(days=2)
+    assert day_button(day) == f"{day.strftime('%b %d')} · {CLOSE_HOUR - OPEN_HOUR} free"
+    book_all_but(day, 10)
+    assert day_button(day) == f"{day.strftime('%b %d')} · 1 free"
+    availability_index.mark_reserved(slot_key(day, 10))
+    # Full days are left out
+    assert day_button(day) is None
+
+def test_held_hours_are_not_counted(keyboard):
+    day = app.dt.now().date() + timedelta(days=2)
+    book_all_but(day, 10)
+    assert day_button(day) == f"{day.strftime('%b %d')} · 1 free"
+    slot_holds.hold(slot_key(day, 10), DEFAULT_COURT, 9, time.time() + 60)
+    # The cached keyboard is rebuilt once the hold is taken
+    assert day_button(day) is None
+    assert app.generate_time_choices(day, 5).masks == ()
+    slot_holds.release(slot_key(day, 10), DEFAULT_COURT, 9)
+    assert day_button(day) == f"{day.strftime('%b %d')} · 1 free"
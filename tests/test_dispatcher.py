@@ -0,0 +1,55 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from dispatcher import ShardedDispatcher, chat_key
+
+def text_update(update_id, chat_id):
+    message = SimpleNamespace(chat=SimpleNamespace(id=chat_id))
+    return SimpleNamespace(update_id=update_id, message=message, edited_message=None, callback_query=None)
+
+def callback_update(update_id, chat_id):
+    callback = SimpleNamespace(message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)), from_user=SimpleNamespace(id=99))
+    return SimpleNamespace(update_id=update_id, message=None, edited_message=None, callback_query=callback)
+
+def test_callbacks_share_their_chat_key():
+    assert chat_key(text_update(1, 7)) == chat_key(callback_update(2, 7)) == 7
+
+def test_each_chat_is_handled_in_arrival_order():
+    handled = {}
+    lock = threading.Lock()
+
+    def process(update):
+        # Uneven handler times would reorder a chat spread over several threads
+        time.sleep(0.001 * (update.update_id % 3))
+        with lock:
+            handled.setdefault(chat_key(update), []).append(update.update_id)
+
+    dispatcher = ShardedDispatcher(process, shards=4)
+    dispatcher.start()
+    updates = [text_update(update_id, update_id % 5) for update_id in range(100)]
+    for update in updates:
+        dispatcher.submit(update)
+    dispatcher.stop()
+    assert handled == {chat: [update_id for update_id in range(100) if update_id % 5 == chat] for chat in range(5)}
+    assert sum(shard['processed'] for shard in dispatcher.stats()) == 100
+
+def test_failures_and_rejected_updates():
+    def process(update):
+        if update.update_id == 1:
+            raise RuntimeError("handler bug")
+
+    dispatcher = ShardedDispatcher(process, shards=1, accept=lambda update: update.update_id != 2)
+    dispatcher.start()
+    for update_id in range(4):
+        assert dispatcher.submit(text_update(update_id, 1))
+    dispatcher.stop()
+    stats = dispatcher.stats()[0]
+    # The failed update doesn't stop the shard; the rejected one never gets there
+    assert (stats['processed'], stats['failed']) == (3, 1)
+
+def test_full_shard_refuses_without_blocking():
+    dispatcher = ShardedDispatcher(lambda update: None, shards=1, max_queue=2)
+    assert dispatcher.submit(text_update(1, 1), block=False)
+    assert dispatcher.submit(text_update(2, 1), block=False)
+    assert not dispatcher.submit(text_update(3, 1), block=False)
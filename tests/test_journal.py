@@ -0,0 +1,39 @@
+import json
+
+from journal import AuditJournal, iter_records, journal_files
+
+def test_records_are_written_and_rotated(tmp_path):
+    path = str(tmp_path / 'reservations.jsonl')
+    journal = AuditJournal(path, batch_size=1, max_bytes=200, backups=2)
+    journal.start()
+    for user_id in range(12):
+        journal.record('booked', user_id=user_id, reservation=f'2026-10-{10 + user_id} 10:00')
+    journal.close()
+    assert journal.written == 12
+    files = journal_files(path)
+    # At most `backups` rotated files, oldest first, then the live one
+    assert files[-1] == path and len(files) == 3
+    assert files[:2] == [f'{path}.2', f'{path}.1']
+    for file_path in files:
+        with open(file_path, encoding='utf-8') as file:
+            assert all(json.loads(line)['event'] == 'booked' for line in file)
+    # The oldest records fell off with the third rotation
+    kept = [record['user_id'] for record in iter_records(path)]
+    assert kept == sorted(kept) and kept[-1] == 11 and kept[0] > 0
+
+def test_query_filters_by_user_and_time(tmp_path):
+    path = str(tmp_path / 'reservations.jsonl')
+    journal = AuditJournal(path, fsync='none')
+    journal.start()
+    journal.record('booked', user_id=1, reservation='2026-10-20 10:00')
+    journal.record('canceled', user_id=1, reservation='2026-10-20 10:00')
+    journal.record('booked', user_id=2, reservation='2026-10-21 18:00')
+    journal.record('booked', user_id=1, reservation='2026-10-22 09:00')
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as file:
+        # A torn last line after a crash is skipped, not fatal
+        file.write('{"event": "boo')
+
+    assert [record['event'] for record in iter_records(path, user_id=1)] == ['booked', 'canceled', 'booked']
+    assert [record['user_id'] for record in iter_records(path, since='2026-10-21')] == [2, 1]
+    assert [record['reservation'] for record in iter_records(path, since='2026-10-20 12:00', until='2026-10-22')] == ['2026-10-21 18:00']
@@ -0,0 +1,64 @@
+import sqlite3
+from datetime import date
+
+from db import MIGRATIONS, format_slot, parse_slot, slot_key
+
+def create_baseline(path, rows):
+    # The table layout of the original bot: one TEXT timestamp per user,
+    # never checked for double bookings or valid input
+    baseline = sqlite3.connect(path)
+    baseline.execute("CREATE TABLE reservations (user_id INTEGER PRIMARY KEY, reservation_time TEXT)")
+    baseline.executemany("INSERT INTO reservations VALUES (?, ?)", rows)
+    baseline.commit()
+    baseline.close()
+
+def test_baseline_database_migrates_to_latest(database):
+    create_baseline(database.DB_PATH, [
+        (1, '2030-05-01 10:00'),
+        (3, 'tomorrow at ten'),
+        (4, None),
+        (5, '2030-05-02 11:00'),
+    ])
+
+    with database.db_connection() as connection:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        rows = connection.execute(
+            "SELECT user_id, slot, court_id, reminded, series_id FROM reservations ORDER BY user_id"
+        ).fetchall()
+
+    assert version == len(MIGRATIONS)
+    # Unparseable rows are dropped, the rest keep their time as a slot key
+    assert rows == [
+        (1, slot_key(date(2030, 5, 1), 10), 1, 0, None),
+        (5, parse_slot('2030-05-02 11:00'), 1, 0, None),
+    ]
+    assert database.get_user_reservation(1) == (slot_key(date(2030, 5, 1), 10), 1)
+    assert database.get_reserved_masks(date(2030, 5, 1), 2) == [
+        (date(2030, 5, 1).toordinal(), 1, 1 << 10),
+        (date(2030, 5, 2).toordinal(), 1, 1 << 11),
+    ]
+
+def test_double_bookings_are_set_aside(database):
+    create_baseline(database.DB_PATH, [
+        (1, '2030-05-01 10:00'),
+        (2, '2030-05-01 10:00'),
+        (3, '2030-05-01 11:00'),
+    ])
+
+    with database.db_connection() as connection:
+        rows = connection.execute("SELECT user_id FROM reservations ORDER BY user_id").fetchall()
+        conflicts = connection.execute("SELECT user_id, slot FROM reservations_conflicts").fetchall()
+
+    # The first booking of the slot wins; the other can still be recovered
+    assert rows == [(1,), (3,)]
+    assert conflicts == [(2, slot_key(date(2030, 5, 1), 10))]
+
+def test_new_database_starts_at_latest_version(database):
+    with database.db_connection() as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        assert connection.execute("SELECT COUNT(*) FROM reservations").fetchone()[0] == 0
+
+def test_slot_keys_round_trip():
+    slot = parse_slot('2026-10-20 19:00')
+    assert slot == slot_key(date(2026, 10, 20), 19)
+    assert format_slot(slot) == '2026-10-20 19:00'
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from outbox import Outbox, BULK
+
+class FakeBot:
+    # Records every Bot API call; `errors` are raised by the next calls in turn
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, method):
+        def call(chat_id, *args, **kwargs):
+            with self._lock:
+                self.calls.append((method, chat_id, args, kwargs))
+                if self.errors:
+                    raise self.errors.pop(0)
+                return len(self.calls)
+        return call
+
+def api_error(code, retry_after=None):
+    result_json = {'error_code': code, 'description': 'error'}
+    if retry_after is not None:
+        result_json['parameters'] = {'retry_after': retry_after}
+    return ApiTelegramException('sendMessage', None, result_json)
+
+def make_outbox(bot, senders=2):
+    return Outbox(bot, senders=senders, global_rate=1000, chat_rate=1000, chat_burst=1000)
+
+def test_plain_texts_to_one_chat_are_merged():
+    bot = FakeBot()
+    outbox = make_outbox(bot)
+    futures = [outbox.send_message(1, text) for text in ('a', 'b', 'c')]
+    outbox.start()
+    assert [future.result(timeout=5) for future in futures] == [1, 1, 1]
+    assert bot.calls == [('send_message', 1, ('a\n\nb\n\nc',), {})]
+    assert outbox.stats()['merged'] == 2
+
+def test_texts_with_options_are_not_merged_into():
+    bot = FakeBot()
+    outbox = make_outbox(bot)
+    outbox.send_message(1, 'a', reply_markup='keyboard')
+    outbox.send_message(1, 'b')
+    # The later text's options apply to the merged message
+    last = outbox.send_message(1, 'c', reply_markup='keyboard')
+    outbox.start()
+    last.result(timeout=5)
+    assert [call[2:] for call in bot.calls] == [
+        (('a',), {'reply_markup': 'keyboard'}),
+        (('b\n\nc',), {'reply_markup': 'keyboard'}),
+    ]
+
+def test_calls_to_one_chat_keep_their_order():
+    bot = FakeBot()
+    outbox = make_outbox(bot, senders=4)
+    futures = []
+    for i in range(20):
+        futures.append(outbox.send_message(1, f'text {i}', reply_markup='keyboard'))
+        futures.append(outbox.send_photo(1, f'photo {i}'))
+        futures.append(outbox.send_message(2, f'other {i}', reply_markup='keyboard'))
+    outbox.start()
+    for future in futures:
+        future.result(timeout=5)
+    chat_1 = [call[2][0] for call in bot.calls if call[1] == 1]
+    assert chat_1 == [item for i in range(20) for item in (f'text {i}', f'photo {i}')]
+    assert [call[2][0] for call in bot.calls if call[1] == 2] == [f'other {i}' for i in range(20)]
+
+def test_interactive_goes_before_bulk():
+    bot = FakeBot()
+    outbox = make_outbox(bot, senders=1)
+    bulk = outbox.send_message(1, 'reminder', priority=BULK)
+    interactive = outbox.send_message(2, 'reply')
+    outbox.start()
+    bulk.result(timeout=5)
+    interactive.result(timeout=5)
+    assert [call[1] for call in bot.calls] == [2, 1]
+
+def test_429_is_retried_after_retry_after():
+    bot = FakeBot(errors=[api_error(429, retry_after=0)])
+    outbox = make_outbox(bot)
+    future = outbox.send_message(1, 'hello')
+    outbox.start()
+    assert future.result(timeout=5) == 2
+    assert [call[2] for call in bot.calls] == [('hello',), ('hello',)]
+    stats = outbox.stats()
+    assert (stats['retried'], stats['sent'], stats['failed']) == (1, 1, 0)
+
+def test_other_api_errors_fail_the_future():
+    error = api_error(400)
+    bot = FakeBot(errors=[error])
+    outbox = make_outbox(bot)
+    future = outbox.send_message(1, 'hello')
+    outbox.start()
+    with pytest.raises(ApiTelegramException):
+        future.result(timeout=5)
+    assert len(bot.calls) == 1
+    assert outbox.stats()['failed'] == 1
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import reminders as reminders_module
+from reminders import ReminderScheduler, Reminder
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def marked(monkeypatch):
+    marked = []
+    monkeypatch.setattr(reminders_module, 'mark_reminded', marked.extend)
+    return marked
+
+def test_reminders_are_marked_once_delivered(marked):
+    futures = []
+
+    def send_batch(batch):
+        futures.extend(Future() for _ in batch)
+        return futures[-len(batch):]
+
+    now = time.time()
+    # Slots are plain timestamps here; lead puts all three in the past
+    scheduler = ReminderScheduler(send_batch, lambda slot: slot, lead=60)
+    scheduler.load([(1, now + 30, 1), (2, now + 40, 1), (3, now - 10, 1)])
+    scheduler.start()
+    try:
+        wait_for(lambda: len(futures) == 2)
+        # The slot that already started is skipped and marked straight away
+        assert marked == [Reminder(3, now - 10, 1)]
+        futures[0].set_result(True)
+        futures[1].set_exception(RuntimeError("Bad Request: chat not found"))
+        assert marked == [Reminder(3, now - 10, 1), Reminder(1, now + 30, 1)]
+        assert (scheduler.sent, scheduler.failed, scheduler.skipped) == (1, 1, 1)
+    finally:
+        scheduler.stop()
+
+def test_removed_and_late_reminders_are_not_sent(marked):
+    sent = []
+
+    def send_batch(batch):
+        sent.extend(batch)
+        future = Future()
+        future.set_result(True)
+        return [future] * len(batch)
+
+    now = time.time()
+    scheduler = ReminderScheduler(send_batch, lambda slot: slot, lead=60)
+    # Booked less than `lead` before the slot: nothing to remind about
+    scheduler.add(1, now + 30, 1)
+    scheduler.load([(2, now + 0.2, 1), (3, now + 0.3, 1)])
+    scheduler.remove(2, now + 0.2, 1)
+    assert scheduler.pending() == 1
+    scheduler.start()
+    try:
+        wait_for(lambda: sent)
+        assert sent == [Reminder(3, now + 0.3, 1)]
+    finally:
+        scheduler.stop()
+
+def test_reminded_reservations_are_not_loaded_again(database):
+    for user_id, slot in ((1, 100), (2, 101)):
+        assert database.save_reservation_to_db(user_id, slot)
+    assert database.get_pending_reminders(0) == [(1, 100, 1), (2, 101, 1)]
+    database.mark_reminded([Reminder(1, 100, 1)])
+    # After a restart only the unsent reminder is scheduled
+    assert database.get_pending_reminders(0) == [(2, 101, 1)]
@@ -0,0 +1,95 @@
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import telegrambot as app
+from availability import INDEX_DAYS
+from booking import book_slot, book_series, series_slots, slot_holds, Booked, SeriesBooked, SeriesConflict
+from db import slot_key
+
+TOMORROW = date.today() + timedelta(days=1)
+
+@pytest.fixture
+def index(database):
+    database.load_availability_index()
+    return database
+
+def count_reservations(database):
+    with database.db_connection() as connection:
+        return connection.execute("SELECT COUNT(*) FROM reservations").fetchone()[0]
+
+def test_book_series_books_every_occurrence(index):
+    slots = series_slots(slot_key(TOMORROW, 19), weeks=3, hours=2)
+    result = book_series(1, slots)
+    assert isinstance(result, SeriesBooked)
+    assert result.slots == slots and result.court_id == 1
+    assert count_reservations(index) == 6
+    # A series doesn't use up the user's ordinary booking
+    assert isinstance(book_slot(1, slot_key(TOMORROW, 8)), Booked)
+
+def test_book_series_conflicts_book_nothing(index):
+    first = slot_key(TOMORROW, 10)
+    slots = series_slots(first, weeks=3, hours=2)
+    book_slot(2, first + 7 * 24 + 1)
+    slot_holds.hold(first + 14 * 24, 1, 3, time.time() + 60)
+    not_before = datetime.combine(TOMORROW, datetime.min.time()).replace(hour=11)
+    result = book_series(1, slots, not_before=not_before)
+    assert result == SeriesConflict(slots, 1, [
+        (first, 'past'),
+        (first + 7 * 24 + 1, 'taken'),
+        (first + 14 * 24, 'held'),
+    ])
+    assert count_reservations(index) == 1
+
+def test_series_slots_limits():
+    today = date(2026, 10, 18)
+    first = slot_key(date(2026, 10, 20), 19)
+    assert series_slots(first, weeks=2, hours=3, today=today) == [first, first + 1, first + 2, first + 168, first + 169, first + 170]
+    with pytest.raises(ValueError):
+        # Past closing time
+        series_slots(first, weeks=1, hours=4, today=today)
+    with pytest.raises(ValueError):
+        series_slots(slot_key(date(2026, 10, 20), 5), today=today)
+    with pytest.raises(ValueError):
+        series_slots(slot_key(date(2026, 10, 17), 10), today=today)
+    with pytest.raises(ValueError):
+        # Last week outside the availability index
+        series_slots(slot_key(today + timedelta(days=INDEX_DAYS), 10), today=today)
+    with pytest.raises(ValueError):
+        series_slots(first, weeks=0, today=today)
+
+@pytest.fixture
+def recurring(index, monkeypatch):
+    # /recurring with just enough of create_app(); returns the replies
+    sent = []
+    monkeypatch.setattr(app, 'courts', {1: 'Court 1'})
+    monkeypatch.setattr(app, 'outbox', SimpleNamespace(send_message=lambda chat_id, text, **kwargs: sent.append(text)))
+    monkeypatch.setattr(app, 'reminders', SimpleNamespace(add=lambda *args: None))
+    monkeypatch.setattr(app, 'record_reservation', lambda *args: None)
+    monkeypatch.setattr(app, 'RECURRING_MAX_SERIES', 1)
+    monkeypatch.setattr(app, 'RECURRING_MAX_HOURS', 26)
+
+    def command(user_id, text):
+        app.recurring(SimpleNamespace(text=text, chat=SimpleNamespace(id=user_id), from_user=SimpleNamespace(id=user_id)))
+        return sent[-1]
+    return command
+
+def test_recurring_limits_for_users(recurring, monkeypatch):
+    start = f"{TOMORROW:%Y-%m-%d} 19:00"
+    assert "at most 26 hours" in recurring(1, f"/recurring {start} 14 2")
+    assert recurring(1, f"/recurring {start} 13 2").startswith("Standing booking #")
+    assert "1 standing booking(s) at a time" in recurring(1, f"/recurring {TOMORROW + timedelta(days=1):%Y-%m-%d} 19:00 2")
+    assert recurring(1, "/recurring").startswith("#")
+    # Admins have no limits
+    monkeypatch.setattr(app, 'ADMIN_IDS', frozenset({2}))
+    assert recurring(2, f"/recurring {start.replace('19:00', '08:00')} 26 2").startswith("Standing booking #")
+
+def test_recurring_conflict_report_fits_one_message(recurring, monkeypatch):
+    monkeypatch.setattr(app, 'ADMIN_IDS', frozenset({1, 2}))
+    assert recurring(1, f"/recurring {TOMORROW:%Y-%m-%d} 06:00 26 16").startswith("Standing booking #")
+    report = recurring(2, f"/recurring {TOMORROW:%Y-%m-%d} 06:00 26 16")
+    assert report.startswith("Nothing was booked: 416 of 416 hour(s)")
+    assert len(report) <= app.MESSAGE_LIMIT
+    assert report.endswith("more")
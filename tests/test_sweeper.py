@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+import sweeper as sweeper_module
+from availability import availability_index
+from db import slot_key
+from sweeper import ExpirySweeper
+
+TODAY = date.today()
+
+def test_past_reservations_move_to_the_archive_in_batches(database, monkeypatch):
+    # Index from three days back, so the past rows are in it too
+    database.load_availability_index(TODAY - timedelta(days=3))
+    yesterday = slot_key(TODAY - timedelta(days=1), 6)
+    past = [yesterday + hour for hour in range(5)]
+    upcoming = slot_key(TODAY + timedelta(days=1), 10)
+    for user_id, slot in enumerate(past + [upcoming]):
+        assert database.save_reservation_to_db(user_id, slot)
+
+    batches = []
+
+    def archive(before_slot, limit):
+        batches.append(database.archive_past_reservations(before_slot, limit))
+        return batches[-1]
+
+    monkeypatch.setattr(sweeper_module, 'archive_past_reservations', archive)
+    sweeper = ExpirySweeper(lambda: slot_key(TODAY, 0), batch_size=2, pause=0)
+    assert sweeper.sweep() == 5
+    assert batches == [2, 2, 1]
+    assert sweeper.archived == 5
+
+    with database.db_connection() as connection:
+        live = connection.execute("SELECT slot FROM reservations").fetchall()
+        archived = connection.execute("SELECT user_id, slot FROM reservations_archive ORDER BY slot").fetchall()
+    assert live == [(upcoming,)]
+    assert archived == list(enumerate(past))
+    # Archived slots are freed in the index; the upcoming one stays reserved
+    assert availability_index.snapshot() == {(upcoming // 24, 1): 1 << 10}
+
+def test_nothing_to_sweep(database):
+    database.load_availability_index()
+    sweeper = ExpirySweeper(lambda: slot_key(TODAY, 0), batch_size=2, pause=0)
+    assert sweeper.sweep() == 0
+    assert sweeper.last_run is not None
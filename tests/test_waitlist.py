@@ -0,0 +1,88 @@
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import telegrambot as app
+from availability import BOOKING_CUTOFF_SECONDS
+from booking import slot_holds
+from db import slot_datetime, slot_key
+from waitlist import Waitlist, ANY_HOUR
+
+TOMORROW = date.today() + timedelta(days=1)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_unclaimed_waitlist_offer_expires_and_moves_on(database):
+    database.load_availability_index()
+    slot = slot_key(TOMORROW, 10)
+    offers = []
+    waitlist = Waitlist(offers.extend, lambda slot: time.time() + 3600, claim_window=0.2)
+    assert waitlist.join(1, TOMORROW.toordinal(), 10)
+    assert waitlist.join(2, TOMORROW.toordinal(), ANY_HOUR)
+    waitlist.start()
+    try:
+        waitlist.slot_freed(slot, 1)
+        assert [offer.user_id for offer in offers] == [1]
+        assert slot_holds.holder(slot, 1) == 1
+        assert waitlist.pending() == 1
+        # User 1 lets the claim window run out; the slot goes to user 2
+        wait_for(lambda: len(offers) == 2)
+        assert offers[1].user_id == 2
+        assert slot_holds.holder(slot, 1) == 2
+        assert waitlist.expired == 1
+        # Declined: nobody else is waiting, so the slot is free for anyone
+        waitlist.decline(2, slot, 1)
+        assert slot_holds.holder(slot, 1) is None
+        assert waitlist.pending() == 0
+        assert database.get_waiters(TOMORROW.toordinal(), 10, 10) == []
+    finally:
+        waitlist.stop()
+
+def test_slots_inside_the_cutoff_are_not_offered(database):
+    database.load_availability_index()
+    offers = []
+    starts_at = time.time() + BOOKING_CUTOFF_SECONDS - 60
+    waitlist = Waitlist(offers.extend, lambda slot: starts_at, claim_window=60)
+    slot = slot_key(TOMORROW, 10)
+    assert waitlist.join(1, TOMORROW.toordinal(), 10)
+    waitlist.slot_freed(slot, 1)
+    assert offers == []
+    assert slot_holds.holder(slot, 1) is None
+
+@pytest.fixture
+def bot(database, monkeypatch):
+    # Just enough of create_app() for the waitlist callbacks
+    database.load_availability_index()
+    sent = []
+    monkeypatch.setattr(app, 'courts', {1: 'Court 1'})
+    monkeypatch.setattr(app, 'outbox', SimpleNamespace(send_message=lambda chat_id, text, **kwargs: sent.append(text)))
+    monkeypatch.setattr(app, 'remember_user', lambda user: None)
+    monkeypatch.setattr(app, 'waitlist', Waitlist(lambda offers: None, lambda slot: time.time() + 3600, claim_window=60))
+    return sent
+
+def callback(user_id, data):
+    return SimpleNamespace(data=data, from_user=SimpleNamespace(id=user_id), message=SimpleNamespace(chat=SimpleNamespace(id=user_id)))
+
+def test_claim_inside_the_cutoff_is_declined(bot, monkeypatch, database):
+    slot = slot_key(TOMORROW, 10)
+    slot_holds.hold(slot, 1, 7, time.time() + 60)
+    # The claim arrives when the slot is about to start
+    monkeypatch.setattr(app, 'not_before_now', lambda: slot_datetime(slot) + timedelta(minutes=1))
+    app.route_callback(callback(7, f'claim:{slot}:1'))
+    assert bot == ["Sorry, this offer has expired."]
+    assert slot_holds.holder(slot, 1) is None
+    assert database.get_user_reservation(7) is None
+
+def test_waitlist_join_is_checked(bot):
+    day = app.dt.now().date() + timedelta(days=2)
+    app.route_callback(callback(7, f'wait:{day.toordinal()}:10'))
+    # Nothing booked yet, so there's no reason to wait
+    assert "isn't fully booked" in bot[-1]
+    app.route_callback(callback(7, f'wait:{(day + timedelta(days=30)).toordinal()}:10'))
+    assert bot[-1].startswith("Sorry, you can only join the waitlist")
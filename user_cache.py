@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class UserCache:
+    # LRU cache of Telegram user profiles with a time-to-live. Entries are
+    # filled from the from_user of incoming updates, so bot.get_chat is only
+    # needed for users we haven't heard from recently.
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or int(os.getenv('USER_CACHE_SIZE', '10000'))
+        self.ttl = ttl or float(os.getenv('USER_CACHE_TTL', str(24 * 3600)))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, profile):
+        # Returns True when the profile is new or differs from the cached one
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            entry = self._entries.get(profile['id'])
+            changed = entry is None or entry[1] != profile
+            self._entries[profile['id']] = (expires, profile)
+            self._entries.move_to_end(profile['id'])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return changed
+
+    def __len__(self):
+        return len(self._entries)
+
+def profile_from_user(user):
+    return {
+        'id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name
+    }
@@ -0,0 +1,139 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+
+from availability import availability_index, BOOKING_CUTOFF_SECONDS
+from booking import slot_holds
+from db import join_waitlist, get_waiters, mark_offered, get_open_offers, remove_waitlist_entry, leave_waitlist, purge_waitlist, slot_date, slot_hour
+
+# Waiting for any hour of the day rather than a specific one
+ANY_HOUR = -1
+
+Offer = namedtuple('Offer', 'entry_id user_id slot court_id until')
+
+class Waitlist:
+    # Hands freed slots to waiting users first come first served. A freed
+    # (slot, court) is held for the first waiter for `claim_window` seconds;
+    # if they don't claim it, their entry is dropped and the slot goes to the
+    # next one. All offers for one cancellation are looked up with a single
+    # indexed query, marked with one UPDATE and passed to `send_offers` as
+    # one batch. Expiring offers sit in a heap like ReminderScheduler's.
+    def __init__(self, send_offers, slot_timestamp, claim_window=None):
+        self.send_offers = send_offers
+        self.slot_timestamp = slot_timestamp
+        self.claim_window = claim_window or float(os.getenv('WAITLIST_CLAIM_WINDOW', '600'))
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.offered = 0
+        self.claimed = 0
+        self.expired = 0
+
+    def load(self, today):
+        # At startup: forget past days and hold outstanding offers again;
+        # offers that ran out while the bot was down expire straight away
+        purge_waitlist(today)
+        for entry_id, user_id, slot, court_id, until in get_open_offers():
+            slot_holds.hold(slot, court_id, user_id, until)
+            self._push(Offer(entry_id, user_id, slot, court_id, until))
+
+    def join(self, user_id, day, hour=ANY_HOUR):
+        return join_waitlist(user_id, day, hour)
+
+    def slot_freed(self, slot, court_id):
+        # Called after a cancellation has been committed
+        try:
+            self._offer(slot, [court_id])
+        except Exception as e:
+            print(f"Failed to offer freed slot {slot}: {e}")
+
+    def _offer(self, slot, courts):
+        # Nobody could book it any more by the time they read the offer
+        if self.slot_timestamp(slot) <= time.time() + BOOKING_CUTOFF_SECONDS:
+            return
+        courts = [court for court in courts if slot_holds.holder(slot, court) is None]
+        if not courts:
+            return
+        waiters = get_waiters(slot // 24, slot_hour(slot), len(courts))
+        if not waiters:
+            return
+        until = time.time() + self.claim_window
+        offers = [Offer(entry_id, user_id, slot, court, until) for (entry_id, user_id), court in zip(waiters, courts)]
+        for offer in offers:
+            slot_holds.hold(slot, offer.court_id, offer.user_id, until)
+        mark_offered([(slot, offer.court_id, until, offer.entry_id) for offer in offers])
+        for offer in offers:
+            self._push(offer)
+        self.offered += len(offers)
+        self.send_offers(offers)
+
+    def claim(self, user_id, slot, court_id):
+        # The user booked the held slot; they are done waiting for that day
+        slot_holds.release(slot, court_id, user_id)
+        leave_waitlist(user_id, slot // 24)
+        self.claimed += 1
+
+    def decline(self, user_id, slot, court_id):
+        # The user can't take the offer (e.g. already booked elsewhere)
+        if slot_holds.release(slot, court_id, user_id):
+            self._next(slot, court_id)
+
+    def _next(self, slot, court_id):
+        # Offer the slot again if nobody has booked it meanwhile
+        if court_id in availability_index.free_courts(slot_date(slot), slot_hour(slot)):
+            self._offer(slot, [court_id])
+
+    def _push(self, offer):
+        with self._cond:
+            heapq.heappush(self._heap, (offer.until, offer))
+            if self._heap[0][1] == offer:
+                self._cond.notify()
+
+    def _next_expired(self):
+        # Blocks until an offer runs out; returns None once stopped
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[1]
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _run(self):
+        while True:
+            offer = self._next_expired()
+            if offer is None:
+                return
+            try:
+                remove_waitlist_entry(offer.entry_id)
+                # Claimed and declined offers have released their hold already
+                if not slot_holds.release(offer.slot, offer.court_id, offer.user_id):
+                    continue
+                self.expired += 1
+                self._next(offer.slot, offer.court_id)
+            except Exception as e:
+                print(f"Failed to expire waitlist offer {offer.entry_id}: {e}")
+
+    def pending(self):
+        # Offers still held for their user; claimed and declined ones stay in
+        # the heap until they would have expired, but no longer hold the slot
+        with self._cond:
+            offers = [offer for _, offer in self._heap]
+        return sum(1 for offer in offers if slot_holds.holder(offer.slot, offer.court_id) == offer.user_id)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='waitlist', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None